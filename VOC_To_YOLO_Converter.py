@@ -0,0 +1,133 @@
+import os
+import logging
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from dataset_index import index_files
+from instrumentation import configure_logging
+
+'''
+The way back from YOLO2VOCConvert: voc xml annotations -> yolo txt labels.
+
+Each xml is streamed with ET.iterparse (elements are cleared once read) and the picture size comes
+from its <size> tag, so the pictures are never opened. The xmls are parsed over a process pool in chunks,
+the class map is built from the names seen in that single pass, then the txt files are written.
+'''
+
+log = logging.getLogger(__name__)
+
+
+# Returns (width, height, [names], (N, 4) float64 xmin - ymin - xmax - ymax) of one voc xml
+def read_voc_xml(xml_file):
+    width = height = None
+    names = []
+    coords = []
+    for event, elem in ET.iterparse(xml_file, events=('end',)):
+        if elem.tag == 'size':
+            width = int(float(elem.findtext('width')))
+            height = int(float(elem.findtext('height')))
+        elif elem.tag == 'object':
+            # Only the direct children, person layout <part>s have their own name/bndbox
+            bndbox = elem.find('bndbox')
+            names.append(elem.findtext('name').strip())
+            coords.append([float(bndbox.findtext(tag)) for tag in ('xmin', 'ymin', 'xmax', 'ymax')])
+            elem.clear()  # done with this object, keep memory flat
+    if not width or not height:
+        raise ValueError("%s: no <size> width/height" % xml_file)
+    return width, height, names, np.array(coords, dtype=np.float64).reshape(-1, 4)
+
+
+# (xmin, ymin, xmax, ymax) pixels -> (x_center, y_center, width, height) relative, the inverse of
+# yolo_labels.yolo_to_voc_boxes (which puts the centre 1 pixel further, voc being 1-based)
+def voc_to_yolo_boxes(coords, width_img, height_img):
+    x_center = ((coords[:, 0] + coords[:, 2]) / 2 - 1) / width_img
+    y_center = ((coords[:, 1] + coords[:, 3]) / 2 - 1) / height_img
+    box_w = (coords[:, 2] - coords[:, 0]) / width_img
+    box_h = (coords[:, 3] - coords[:, 1]) / height_img
+    return np.stack([x_center, y_center, box_w, box_h], axis=1)
+
+
+class VOC2YOLOConvert:
+    def __init__(self, xmls_path, txts_path, classes=None):
+        self.xmls_path = xmls_path   # voc format xml annotations
+        self.txts_path = txts_path   # Save path of the yolo format label files
+        # Known class names keep their index (same list as YOLO2VOCConvert.classes), new names are appended sorted
+        self.classes = list(classes) if classes is not None else ["person", "car"]
+
+    # workers > 1 parses the xmls in a process pool, chunk_size files per work unit.
+    # Returns a summary {'converted', 'objects', 'failed', 'errors': [(xml_name, error)], 'classes', 'duplicates'},
+    # duplicates being xmls sharing a stem (a.xml and a.XML), none of which is converted
+    def voc2yolo(self, workers=1, chunk_size=64, recursive=False):
+        if not os.path.exists(self.txts_path):
+            os.makedirs(self.txts_path)
+
+        xmls, duplicates = index_files(self.xmls_path, lambda name, extension: extension == '.xml', recursive)
+        xml_names = [xmls[stem] for stem in sorted(xmls)]
+        if duplicates:
+            log.warning("%d xmls share a stem with another xml, none of them is converted, e.g. %s", len(duplicates), duplicates[:5])
+        chunks = [xml_names[i:i + chunk_size] for i in range(0, len(xml_names), chunk_size)]
+
+        if workers <= 1:
+            results = [_parse_chunk(self.xmls_path, chunk) for chunk in chunks]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(_parse_chunk, [self.xmls_path] * len(chunks), chunks))
+
+        # Class map from every name seen in the pass
+        class_ids = dict((name, i) for i, name in enumerate(self.classes))
+        seen = set()
+        for parsed, errors in results:
+            for xml_name, names, boxes in parsed:
+                seen.update(names)
+        for name in sorted(seen - set(class_ids)):
+            class_ids[name] = len(self.classes)
+            self.classes.append(name)
+
+        summary = {'converted': 0, 'objects': 0, 'failed': 0, 'errors': [], 'classes': self.classes, 'duplicates': duplicates}
+        for parsed, errors in results:
+            summary['errors'].extend(errors)
+            for xml_name, names, boxes in parsed:
+                self.write_txt(xml_name, [class_ids[name] for name in names], boxes)
+                summary['converted'] += 1
+                summary['objects'] += len(names)
+        summary['failed'] = len(summary['errors'])
+
+        with open(os.path.join(self.txts_path, 'classes.txt'), 'w') as f:
+            for name in self.classes:
+                f.write(name + '\n')
+
+        log.info("Converted: %d files, %d objects, failed: %d, classes: %s", summary['converted'], summary['objects'], summary['failed'], self.classes)
+        for xml_name, error in summary['errors']:
+            log.error("Failed to convert %s: %s", xml_name, error)
+        return summary
+
+    def write_txt(self, xml_name, ids, boxes):
+        txt_file = os.path.join(self.txts_path, os.path.splitext(xml_name)[0] + '.txt')
+        txt_dir = os.path.dirname(txt_file)
+        if not os.path.exists(txt_dir):  # xml from a sub folder (recursive)
+            os.makedirs(txt_dir, exist_ok=True)
+        with open(txt_file, 'w') as f:
+            for class_id, (x_center, y_center, box_w, box_h) in zip(ids, boxes.tolist()):
+                f.write("%d %.6f %.6f %.6f %.6f\n" % (class_id, x_center, y_center, box_w, box_h))
+
+
+# Parse a chunk of xmls: returns ([(xml_name, [names], (N, 4) yolo boxes)], [(xml_name, error)])
+def _parse_chunk(xmls_path, xml_names):
+    parsed = []
+    errors = []
+    for xml_name in xml_names:
+        try:
+            width, height, names, coords = read_voc_xml(os.path.join(xmls_path, xml_name))
+            parsed.append((xml_name, names, voc_to_yolo_boxes(coords, width, height)))
+        except Exception as e:
+            errors.append((xml_name, repr(e)))
+    return parsed, errors
+
+
+if __name__ == '__main__':
+    configure_logging()
+    xmls_path1 = 'Annotations_xml'
+    txts_path1 = 'Annotations_txt'
+
+    voc2yolo_obj1 = VOC2YOLOConvert(xmls_path1, txts_path1)
+    voc2yolo_obj1.voc2yolo(workers=os.cpu_count())
@@ -2,9 +2,24 @@ __Author__ = "Shliang"
 __Email__ = "shliang0603@gmail.com"
 
 import os
+import logging
+import argparse
 import xml.etree.ElementTree as ET
-from xml.dom.minidom import Document
-import cv2
+from concurrent.futures import ProcessPoolExecutor
+from voc_xml import format_voc_xml
+from annotation_sink import XMLDirectorySink, ListSink
+import copy
+from image_size import ImageSizeCache
+from dataset_index import pair_images_labels
+from coco_export import export_coco
+from label_stats import scan_labels, print_report
+from conversion_manifest import ConversionManifest, source_signature
+from yolo_labels import LabelStore, read_yolo_labels, yolo_to_voc_boxes
+from instrumentation import StageTimers, Progress, configure_logging, profiled, LOG_LEVELS
+import numpy as np
+
+# Per-file messages are DEBUG, summaries INFO (see instrumentation.configure_logging)
+log = logging.getLogger(__name__)
 
 '''
 import xml
@@ -18,33 +33,35 @@ def writexml(self,
 '''
 
 class YOLO2VOCConvert:
-    def __init__(self, txts_path, xmls_path, imgs_path):
+    def __init__(self, txts_path, xmls_path, imgs_path, size_cache_path=None, sink=None):
         self.txts_path = txts_path   # Annotated yolo format label file path
         self.xmls_path = xmls_path   # Save path after converting to voc format label
         self.imgs_path = imgs_path   # Read the path and name of the picture, and store it in the xml tag file
         self.classes = ["person", "car"]
+        # Picture sizes are read from the file header, and remembered in size_cache_path (json) if given
+        self.size_cache = ImageSizeCache(size_cache_path)
+        # Where the xml annotations go, one file each in xmls_path unless another sink (e.g. annotation_sink.ShardedSink) is given
+        self.sink = sink if sink is not None else XMLDirectorySink(xmls_path)
+        # Seconds spent per stage of convert_pair (probe, parse, transform, serialize, write), workers included
+        self.timers = StageTimers()
 
     # Extract all categories from all txt files. The label format category in yolo format is the number 0,1,...
     # When writer is True, save the extracted categories to the file'./Annotations/classes.txt'
-    def search_all_classes(self, writer=False):
-        # Read each txt label file and take out the label information of each target
-        all_names = set()
-        txts = os.listdir(self.txts_path)
-        # Use list generation to filter out only tag files with the suffix txt
-        txts = [txt for txt in txts if txt.split('.')[-1] == 'txt']
-        print(len(txts), txts)
-        # 11 ['0002030.txt', '0002031.txt', ... '0002039.txt', '0002040.txt']
-        for txt in txts:
-            txt_file = os.path.join(self.txts_path, txt)
-            with open(txt_file, 'r') as f:
-                objects = f.readlines()
-                for object in objects:
-                    object = object.strip().split(' ')
-                    print(object)  # ['2', '0.506667', '0.553333', '0.490667', '0.658667']
-                    all_names.add(int(object[0]))
-            # print(objects)  # ['2 0.506667 0.553333 0.490667 0.658667\n', '0 0.496000 0.285333 0.133333 0.096000\n', '8 0.501333 0.412000 0.074667 0.237333\n']
-
-        print("All category tags:", all_names, "Co-labeled data set: %d sheets" % len(txts))
+    # With the stats of check_labels the categories come from its per id counts, no second read of the files
+    def search_all_classes(self, writer=False, stats=None):
+        if stats is not None:
+            all_names = sorted(stats['class_id_counts'])
+            files = stats['files']
+        else:
+            # Read all txt label files into one (N, 5) box array (class id + cxcywh per row),
+            # the categories are the unique values of its first column
+            label_store = LabelStore.from_dir(self.txts_path)
+            log.debug("%d %s", len(label_store), label_store.names)
+            # 11 ['0002030.txt', '0002031.txt', ... '0002039.txt', '0002040.txt']
+            all_names = [int(class_id) for class_id in label_store.class_ids()]
+            files = len(label_store)
+
+        log.info("All category tags: %s Co-labeled data set: %d sheets", all_names, files)
 
         # Write the categories extracted from the xmls tag file into the file'./Annotations/classes.txt'
         # if writer:
@@ -52,12 +69,26 @@ class YOLO2VOCConvert:
         #         for label in all_names:
         #             f.write(label + '\n')
 
-        return list(all_names)
-
-    def yolo2voc(self):
+        return all_names
+
+    # Pre-flight check of all label files in one scan: class histogram, box size/aspect distributions,
+    # and counts (with file/row locations) of bad class ids, coordinates outside [0, 1], zero-size and duplicate boxes.
+    # Returns the statistics dict of label_stats.scan_labels
+    def check_labels(self, workers=1, chunk_size=256, max_locations=100):
+        stats = scan_labels(self.txts_path, len(self.classes), workers=workers, chunk_size=chunk_size, max_locations=max_locations)
+        print_report(stats, self.classes)
+        return stats
+
+    # workers > 1 converts the pairs in a process pool, chunk_size pairs per work unit.
+    # With manifest_path (json) the run is incremental: pairs whose label and picture are unchanged since
+    # the last run are skipped, and xmls of labels that disappeared are deleted.
+    # recursive=True also pairs pictures and labels in sub folders, the xmls get the same sub folders
+    def yolo2voc(self, workers=1, chunk_size=64, manifest_path=None, recursive=False):
         # Create a folder to save the xml tag file
-        if not os.path.exists(self.xmls_path):
+        if isinstance(self.sink, XMLDirectorySink) and not os.path.exists(self.xmls_path):
             os.mkdir(self.xmls_path)
+        if manifest_path is not None and not isinstance(self.sink, XMLDirectorySink):
+            raise ValueError("incremental runs (manifest_path) need the xml directory sink, shards can't be updated in place")
 
         # # Read each picture, get the size information of the picture (shape)
         # imgs = os.listdir(self.imgs_path)
@@ -82,143 +113,180 @@ class YOLO2VOCConvert:
         #             print(object)  # ['2', '0.506667', '0.553333', '0.490667', '0.658667']
 
         # Rewrite the above two loops into one loop:
-        imgs = os.listdir(self.imgs_path)
-        txts = os.listdir(self.txts_path)
-        txts = [txt for txt in txts if not txt.split('.')[0] == "classes"]  # Filter out the classes.txt file
-        print(txts)
-        # Note, here keep the number of pictures equal to the number of label txt files, and ensure that the names are in one-to-one correspondence (later improvement, just by judging whether the txt file name is in imgs)
-        if len(imgs) == len(txts):   # Note: ./Annotation_txt Do not put the classes.txt file into it
-            map_imgs_txts = [(img, txt) for img, txt in zip(imgs, txts)]
-            txts = [txt for txt in txts if txt.split('.')[-1] == 'txt']
-            print(len(txts), txts)
-            for img_name, txt_name in map_imgs_txts:
-                # Read the scale information of the picture
-                print("Read picture:", img_name)
-                img = cv2.imread(os.path.join(self.imgs_path, img_name))
-                height_img, width_img, depth_img = img.shape
-                print(height_img, width_img, depth_img)   # h is the number of rows (corresponding to the height of the picture), w is the number of columns (corresponding to the width of the picture)
-
-                # Get the label information in the label file txt
-                all_objects = []
-                txt_file = os.path.join(self.txts_path, txt_name)
-                with open(txt_file, 'r') as f:
-                    objects = f.readlines()
-                    for object in objects:
-                        object = object.strip().split(' ')
-                        all_objects.append(object)
-                        print(object)  # ['2', '0.506667', '0.553333', '0.490667', '0.658667']
-
-                # Create tags in the xml tag file
-                xmlBuilder = Document()
-                # Create an annotation tag, which is also the root tag
-                annotation = xmlBuilder.createElement("annotation")
-
-                # Add a subtag to the label annotation
-                xmlBuilder.appendChild(annotation)
-
-                # Create subtag folder
-                folder = xmlBuilder.createElement("folder")
-                # Store content in the subtag folder, the content in the folder tag is the folder where the pictures are stored, for example: JPEGImages
-                folderContent = xmlBuilder.createTextNode(self.imgs_path.split('/')[-1])  # Tag memory
-                folder.appendChild(folderContent)  # Save content to label
-                annotation.appendChild(folder)   # Put the stored folder tag under the annotation root tag
-
-                # Create subtag filename
-                filename = xmlBuilder.createElement("filename")
-                # Store the content in the subtag filename, the content in the filename tag is the name of the picture, for example: 000250.jpg
-                filenameContent = xmlBuilder.createTextNode(txt_name.split('.')[0] + '.jpg')  # Label content
-                filename.appendChild(filenameContent)
-                annotation.appendChild(filename)
-
-                # Store the shape of the picture in the xml tag
-                size = xmlBuilder.createElement("size")
-                # Create subtag width for size tag
-                width = xmlBuilder.createElement("width")  # size subtag width
-                widthContent = xmlBuilder.createTextNode(str(width_img))
-                width.appendChild(widthContent)
-                size.appendChild(width)   # Add width as a subtag of size
-                # Create a subtag height for the size tag
-                height = xmlBuilder.createElement("height")  # size subtag height
-                heightContent = xmlBuilder.createTextNode(str(height_img))  # The content stored in the xml tag is a string
-                height.appendChild(heightContent)
-                size.appendChild(height)  # Add width as a subtag of size
-                # Create a subtag depth for the size tag
-                depth = xmlBuilder.createElement("depth")  # size subtag width
-                depthContent = xmlBuilder.createTextNode(str(depth_img))
-                depth.appendChild(depthContent)
-                size.appendChild(depth)  # Add width as a subtag of size
-                annotation.appendChild(size)   # Add size as a subtag of annotation
-
-                # Stored in each object is ['2', '0.506667', '0.553333', '0.490667', '0.658667'] an annotation target
-                for object_info in all_objects:
-                    # Start creating a label to label the label information of the target
-                    object = xmlBuilder.createElement("object")  # Create object tag
-                    # Create label category label
-                    # Create name tag
-                    imgName = xmlBuilder.createElement("name")  # Create name tag
-                    imgNameContent = xmlBuilder.createTextNode(self.classes[int(object_info[0])])
-                    imgName.appendChild(imgNameContent)
-                    object.appendChild(imgName)  # Add name as a subtag of object
-
-                    # Create pose tag
-                    pose = xmlBuilder.createElement("pose")
-                    poseContent = xmlBuilder.createTextNode("Unspecified")
-                    pose.appendChild(poseContent)
-                    object.appendChild(pose)  # Add pose as the tag of object
-
-                    # Create truncated tags
-                    truncated = xmlBuilder.createElement("truncated")
-                    truncatedContent = xmlBuilder.createTextNode("0")
-                    truncated.appendChild(truncatedContent)
-                    object.appendChild(truncated)
-
-                    # Create difficult tags
-                    difficult = xmlBuilder.createElement("difficult")
-                    difficultContent = xmlBuilder.createTextNode("0")
-                    difficult.appendChild(difficultContent)
-                    object.appendChild(difficult)
-
-                    # First convert the coordinates
-                    # (objx_center, objy_center, obj_width, obj_height)->(xmin，ymin, xmax,ymax)
-                    x_center = float(object_info[1])*width_img + 1
-                    y_center = float(object_info[2])*height_img + 1
-                    xminVal = int(x_center - 0.5*float(object_info[3])*width_img)   # The elements in the object_info list are all string types
-                    yminVal = int(y_center - 0.5*float(object_info[4])*height_img)
-                    xmaxVal = int(x_center + 0.5*float(object_info[3])*width_img)
-                    ymaxVal = int(y_center + 0.5*float(object_info[4])*height_img)
-
-
-
-                    # Create bndbox label (three-level label)
-                    bndbox = xmlBuilder.createElement("bndbox")
-                    # Create four more sub-labels (xmin, ymin, xmax, ymax) under the bndbox label to mark the coordinates and width and height information of the object
-                    # In the voc format, label information: coordinates of the upper left corner (xmin, ymin) (xmax, ymax) coordinates of the lower right corner
-                    # 1. Create xmin label
-                    xmin = xmlBuilder.createElement("xmin")  # Create xmin label (four-level label)
-                    xminContent = xmlBuilder.createTextNode(str(xminVal))
-                    xmin.appendChild(xminContent)
-                    bndbox.appendChild(xmin)
-                    # 2, create ymin label
-                    ymin = xmlBuilder.createElement("ymin")  # Create ymin label (four-level label)
-                    yminContent = xmlBuilder.createTextNode(str(yminVal))
-                    ymin.appendChild(yminContent)
-                    bndbox.appendChild(ymin)
-                    # 3. Create xmax label
-                    xmax = xmlBuilder.createElement("xmax")  # Create xmax label (four-level label)
-                    xmaxContent = xmlBuilder.createTextNode(str(xmaxVal))
-                    xmax.appendChild(xmaxContent)
-                    bndbox.appendChild(xmax)
-                    # 4. Create a ymax label
-                    ymax = xmlBuilder.createElement("ymax")  # Create ymax label (four-level label)
-                    ymaxContent = xmlBuilder.createTextNode(str(ymaxVal))
-                    ymax.appendChild(ymaxContent)
-                    bndbox.appendChild(ymax)
-
-                    object.appendChild(bndbox)
-                    annotation.appendChild(object)  # Add object as a subtag of annotation
-                f = open(os.path.join(self.xmls_path, txt_name.split('.')[0]+'.xml'), 'w')
-                xmlBuilder.writexml(f, indent='\t', newl='\n', addindent='\t', encoding='utf-8')
-                f.close()
+        # Pictures and labels are paired by file name stem (0002030.jpg <-> 0002030.txt) from one scan of each folder,
+        # classes.txt is left out. Files without a partner are reported and skipped instead of blocking the run
+        map_imgs_txts, orphan_imgs, orphan_txts, duplicates = pair_images_labels(self.imgs_path, self.txts_path, recursive)
+        log.info("%d picture/label pairs", len(map_imgs_txts))
+        if orphan_imgs:
+            log.warning("%d pictures without a label, e.g. %s", len(orphan_imgs), orphan_imgs[:5])
+        if orphan_txts:
+            log.warning("%d labels without a picture, e.g. %s", len(orphan_txts), orphan_txts[:5])
+        if duplicates:
+            log.warning("%d files belong to a stem shared by two pictures or two labels, none of them is converted, e.g. %s",
+                        len(duplicates), duplicates[:5])
+
+        if manifest_path is None:
+            summary = self.convert_pairs(map_imgs_txts, workers=workers, chunk_size=chunk_size)
+            summary['skipped'] = summary['removed'] = 0
+        else:
+            summary = self.convert_changed_pairs(map_imgs_txts, manifest_path, workers=workers, chunk_size=chunk_size)
+        self.size_cache.save()
+        self.sink.close()
+        summary['orphan_images'] = orphan_imgs
+        summary['orphan_labels'] = orphan_txts
+        summary['duplicates'] = duplicates
+        log.info("Converted: %d files, %d objects, failed: %d, skipped (unchanged): %d, removed: %d",
+                 summary['converted'], summary['objects'], summary['failed'], summary['skipped'], summary['removed'])
+        for txt_name, error in summary['errors']:
+            log.error("Failed to convert %s: %s", txt_name, error)
+        self.timers.report()
+        return summary
+
+    # Export the pictures/labels to one COCO json file instead of voc xmls, streamed through partial files
+    # so memory stays flat; workers > 1 writes the partial files from a process pool
+    def yolo2coco(self, json_path, workers=1, chunk_size=256, recursive=False):
+        summary = export_coco(self, json_path, workers=workers, chunk_size=chunk_size, recursive=recursive)
+        log.info("Exported: %d images, %d annotations, failed: %d", summary['images'], summary['annotations'], summary['failed'])
+        for txt_name, error in summary['errors']:
+            log.error("Failed to export %s: %s", txt_name, error)
+        return summary
+
+    # Convert one (picture, yolo txt) pair into a voc xml annotation written to sink (self.sink by default),
+    # returns the number of objects written
+    def convert_pair(self, img_name, txt_name, sink=None):
+        # Read the scale information of the picture (only the header is parsed, no full decode)
+        with self.timers.stage('probe'):
+            height_img, width_img, depth_img = self.size_cache.get(os.path.join(self.imgs_path, img_name))
+        log.debug("Read picture: %s %d %d %d", img_name, height_img, width_img, depth_img)   # h is the number of rows (corresponding to the height of the picture), w is the number of columns (corresponding to the width of the picture)
+
+        # Get the label information in the label file txt, one row [2, 0.506667, 0.553333, 0.490667, 0.658667] per target
+        # (float64 rather than the float32 of the label store, so the coordinates come out exactly as before)
+        with self.timers.stage('parse'):
+            all_objects = read_yolo_labels(os.path.join(self.txts_path, txt_name), dtype=np.float64)
+
+        # First convert the coordinates of all targets at once
+        # (objx_center, objy_center, obj_width, obj_height)->(xmin，ymin, xmax,ymax)
+        with self.timers.stage('transform'):
+            all_bndboxes = yolo_to_voc_boxes(all_objects, width_img, height_img)
+
+        # Write the voc xml straight from a template, the output is the same as the xml.dom.minidom
+        # Document that build_voc_document creates, written with writexml(f, indent='\t', newl='\n', addindent='\t', encoding='utf-8')
+        folder_text = self.imgs_path.split('/')[-1]  # the folder where the pictures are stored, for example: JPEGImages
+        filename_text = os.path.basename(img_name)  # the name of the picture, for example: 000250.jpg (or .png, .bmp, ...)
+        with self.timers.stage('serialize'):
+            objects = [(self.classes[int(object_info[0])], xminVal, yminVal, xmaxVal, ymaxVal)
+                       for object_info, (xminVal, yminVal, xmaxVal, ymaxVal) in zip(all_objects.tolist(), all_bndboxes.tolist())]
+            xml_text = format_voc_xml(folder_text, filename_text, width_img, height_img, depth_img, objects)
+        with self.timers.stage('write'):
+            (sink or self.sink).write(self.xml_name(txt_name), xml_text)
+        return len(all_objects)
+
+    # Name of the annotation of a label, relative to the sink: 0002030.txt -> 0002030.xml
+    def xml_name(self, txt_name):
+        return os.path.splitext(txt_name)[0]+'.xml'
+
+    def xml_file(self, txt_name):
+        return os.path.join(self.xmls_path, self.xml_name(txt_name))
+
+    # Convert a list of (picture, txt) pairs, serially or sharded over a process pool.
+    # A bad pair doesn't stop the run, its error is collected in the returned summary:
+    # {'converted': files, 'objects': objects, 'failed': files, 'errors': [(txt_name, error), ...]}
+    def convert_pairs(self, pairs, workers=1, chunk_size=64):
+        summary = {'converted': 0, 'objects': 0, 'failed': 0, 'errors': []}
+        chunks = [pairs[i:i + chunk_size] for i in range(0, len(pairs), chunk_size)]
+        progress = Progress(len(pairs), "yolo2voc")
+        if workers <= 1:
+            for chunk in chunks:
+                self._add_result(summary, _convert_chunk(self, chunk, self.sink))
+                progress.update(len(chunk))
+            return summary
+
+        worker_converter = self
+        if not self.sink.parallel_safe:
+            # Workers hand their annotations back and this process writes them to the sink
+            worker_converter = copy.copy(self)
+            worker_converter.sink = None
+        # The converter is sent to each worker once, not with every chunk
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(worker_converter,)) as executor:
+            for result in executor.map(_convert_worker_chunk, chunks):
+                self._add_result(summary, result)
+                for name, text in result[4]:
+                    # Same as a write failing in convert_pair: the pair fails, the run goes on
+                    try:
+                        self.sink.write(name, text)
+                    except Exception as e:
+                        summary['converted'] -= 1
+                        summary['objects'] -= text.count('<object>')
+                        summary['failed'] += 1
+                        summary['errors'].append((os.path.splitext(name)[0] + '.txt', repr(e)))
+                progress.update(result[0] + len(result[2]))
+        return summary
+
+    def _add_result(self, summary, result):
+        converted, objects, errors, sizes, items, timings = result
+        summary['converted'] += converted
+        summary['objects'] += objects
+        summary['failed'] += len(errors)
+        summary['errors'].extend(errors)
+        self.size_cache.update(sizes)
+        self.timers.merge(timings)
+
+    # Incremental convert_pairs: only the pairs that changed since the run recorded in manifest_path are
+    # converted, the summary also counts 'skipped' (unchanged) and 'removed' (xmls of vanished labels)
+    def convert_changed_pairs(self, pairs, manifest_path, workers=1, chunk_size=64):
+        # A different class list or picture folder changes every xml, and in a different xml folder none exist yet,
+        # the manifest is only reused with the same settings
+        manifest = ConversionManifest(manifest_path, {'classes': self.classes, 'imgs_path': self.imgs_path, 'xmls_path': self.xmls_path})
+        removed = manifest.remove_vanished(pairs)
+        changed, skipped = manifest.changed_pairs(pairs, self.imgs_path, self.txts_path)
+        # Signatures are taken before converting, so a label edited during the run is picked up next time
+        signatures = [source_signature(os.path.join(self.imgs_path, img_name), os.path.join(self.txts_path, txt_name))
+                      for img_name, txt_name in changed]
+
+        summary = self.convert_pairs(changed, workers=workers, chunk_size=chunk_size)
+        failed = set(txt_name for txt_name, error in summary['errors'])
+        for (img_name, txt_name), signature in zip(changed, signatures):
+            if txt_name in failed:
+                manifest.forget(txt_name)  # retried on the next run
+            else:
+                manifest.record(txt_name, os.path.join(self.imgs_path, img_name), os.path.join(self.txts_path, txt_name),
+                                self.xml_file(txt_name), signature)
+        manifest.save()
+
+        summary['skipped'] = skipped
+        summary['removed'] = removed
+        return summary
+
+
+# Converter used by the current pool worker process, set once by _init_worker
+_worker_converter = None
+
+
+def _init_worker(converter):
+    global _worker_converter
+    _worker_converter = converter
+
+
+def _convert_worker_chunk(pairs):
+    if _worker_converter.sink is None:
+        return _convert_chunk(_worker_converter, pairs, ListSink())
+    return _convert_chunk(_worker_converter, pairs, _worker_converter.sink)
+
+
+# Returns (converted files, objects, [(txt_name, error)], picture sizes probed in this chunk,
+# [(name, xml text)] collected when sink is a ListSink, stage timings of this chunk)
+def _convert_chunk(converter, pairs, sink):
+    converted = 0
+    objects = 0
+    errors = []
+    for img_name, txt_name in pairs:
+        try:
+            objects += converter.convert_pair(img_name, txt_name, sink)
+            converted += 1
+        except Exception as e:
+            errors.append((txt_name, repr(e)))
+    items = sink.items if isinstance(sink, ListSink) else []
+    return converted, objects, errors, converter.size_cache.take_updates(), items, converter.timers.take()
 
 
 
@@ -228,11 +296,23 @@ class YOLO2VOCConvert:
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--log-level', default='INFO', choices=LOG_LEVELS, help='DEBUG also logs every picture')
+    parser.add_argument('--timings-json', default=None, help='write the seconds spent per stage to this json file')
+    parser.add_argument('--profile', default=None, help='write cProfile stats of the run to this file')
+    args = parser.parse_args()
+    configure_logging(args.log_level)
+
     txts_path1 = r'C:\AIML_COE\EagleView_Assignment\dataset\New'
     xmls_path1 = 'Annotations_xml'
     imgs_path1 = r'C:\AIML_COE\EagleView_Assignment\dataset\New_images'
 
-    yolo2voc_obj1 = YOLO2VOCConvert(txts_path1, xmls_path1, imgs_path1)
-    labels = yolo2voc_obj1.search_all_classes()
-    print('labels: ', labels)
-    yolo2voc_obj1.yolo2voc()
+    yolo2voc_obj1 = YOLO2VOCConvert(txts_path1, xmls_path1, imgs_path1, size_cache_path='image_sizes.json')
+    with profiled(args.profile):
+        # The check goes first: it reports malformed files instead of stopping at the first one
+        stats = yolo2voc_obj1.check_labels(workers=os.cpu_count())
+        labels = yolo2voc_obj1.search_all_classes(stats=stats)
+        print('labels: ', labels)
+        yolo2voc_obj1.yolo2voc(workers=os.cpu_count())
+    if args.timings_json is not None:
+        yolo2voc_obj1.timers.dump_json(args.timings_json)
@@ -0,0 +1,127 @@
+import io
+import os
+import json
+import time
+import tarfile
+
+'''
+Where converted annotations are written.
+
+XMLDirectorySink is the default: one xml file per picture, in a folder.
+ShardedSink packs the annotations into size bounded tar shards (shard-00000.tar, shard-00001.tar, ...)
+written through a large buffer, plus index.json mapping each annotation name to (shard, offset, size),
+so millions of annotations become a few hundred files. ShardReader reads one annotation back
+from the index with a single seek, or the shards can be unpacked with any tar tool.
+'''
+
+SHARD_BUFFER_BYTES = 1 << 20
+DEFAULT_SHARD_BYTES = 256 << 20
+
+
+class XMLDirectorySink:
+    # Workers of a process pool can all write into the same folder
+    parallel_safe = True
+
+    def __init__(self, xmls_path):
+        self.xmls_path = xmls_path
+
+    def write(self, name, text):
+        xml_file = os.path.join(self.xmls_path, name)
+        xml_dir = os.path.dirname(xml_file)
+        if not os.path.exists(xml_dir):  # annotation from a sub folder (recursive pairing)
+            os.makedirs(xml_dir, exist_ok=True)
+        f = open(xml_file, 'w')
+        f.write(text)
+        f.close()
+
+    def close(self):
+        pass
+
+
+class ListSink:
+    # Keeps the annotations in memory, used by pool workers to hand them back to the process owning the real sink
+    parallel_safe = True
+
+    def __init__(self):
+        self.items = []
+
+    def write(self, name, text):
+        self.items.append((name, text))
+
+    def close(self):
+        pass
+
+
+class ShardedSink:
+    # Only one process may append to the shards, workers hand their annotations back to it
+    parallel_safe = False
+
+    def __init__(self, shards_path, max_shard_bytes=DEFAULT_SHARD_BYTES):
+        self.shards_path = shards_path
+        self.max_shard_bytes = max_shard_bytes
+        self.index = {}
+        self.shard_count = 0
+        self.shard_file = None
+        self.tar = None
+        if not os.path.exists(shards_path):
+            os.makedirs(shards_path)
+
+    def _open_shard(self):
+        shard_name = "shard-%05d.tar" % self.shard_count
+        self.shard_count += 1
+        self.shard_name = shard_name
+        self.shard_file = open(os.path.join(self.shards_path, shard_name), 'wb', buffering=SHARD_BUFFER_BYTES)
+        # PAX, so names longer than the 100 characters of a plain USTAR header are stored too
+        self.tar = tarfile.open(fileobj=self.shard_file, mode='w', format=tarfile.PAX_FORMAT)
+
+    def _close_shard(self):
+        if self.tar is not None:
+            self.tar.close()
+            self.shard_file.close()
+            self.tar = self.shard_file = None
+
+    def write(self, name, text):
+        if self.tar is None or self.shard_file.tell() >= self.max_shard_bytes:
+            self._close_shard()
+            self._open_shard()
+        data = text.encode('utf-8')
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        self.tar.addfile(info, io.BytesIO(data))
+        # A long name adds PAX extended headers in front of the member, so count back from its end:
+        # the data is padded to whole blocks and the tar offset is just behind it
+        padded = -(-len(data) // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+        self.index[name] = [self.shard_name, self.tar.offset - padded, len(data)]
+
+    def close(self):
+        self._close_shard()
+        tmp_path = os.path.join(self.shards_path, 'index.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, os.path.join(self.shards_path, 'index.json'))
+
+
+class ShardReader:
+    def __init__(self, shards_path):
+        self.shards_path = shards_path
+        with open(os.path.join(shards_path, 'index.json'), 'r') as f:
+            self.index = json.load(f)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def names(self):
+        return list(self.index)
+
+    # Text of one annotation, by the name it was written with (e.g. "0002030.xml"), or by its stem
+    def read(self, name):
+        if name not in self.index:
+            name += '.xml'
+        shard_name, offset, size = self.index[name]
+        with open(os.path.join(self.shards_path, shard_name), 'rb') as f:
+            f.seek(offset)
+            return f.read(size).decode('utf-8')
@@ -0,0 +1,70 @@
+
+# Objective: Augmentations computed in memory at read time, nothing written to disk
+#
+# AugmentedDataset wraps a folder of annotated images (same layout as autoaugment: image + xml
+# side by side) and gives, for every image, the original plus the variants the policy rolled,
+# as (image, boxes, names) with boxes a (N, 4) int array of xmin - ymin - xmax - ymax and names
+# the object class of each row. Training loaders can index it (dataset[i]) or iterate over it.
+#
+# policy: {op name: probability} over the ops registered in autoaugment.AUGMENTATIONS
+# seed:   with a seed, image i of epoch e always gets the same augmentations (see autoaugment.ImageRNG),
+#         call SetEpoch(e) between epochs to get new ones
+
+import os
+import random
+import autoaugment
+
+DEFAULT_POLICY = {"noise": 0.8, "blur": 0.8, "flips": 0.8, "darkenlighten": 0.8}
+
+class AugmentedDataset:
+    def __init__(self, inputdir="Images/", policy=None, seed=None, include_original=True):
+        self.inputdir = inputdir if inputdir.endswith("/") else inputdir + "/"
+        self.policy = dict(policy if policy is not None else DEFAULT_POLICY)
+        self.seed = seed
+        self.include_original = include_original
+        self.epoch = 0
+        self.filenames = sorted(filename for filename in os.listdir(self.inputdir) if autoaugment.CheckIfImage(filename))
+        unknown = [name for name in self.policy if name not in autoaugment.AUGMENTATIONS]
+        if unknown:
+            raise ValueError("unknown augmentation(s) %s, registered: %s" % (unknown, list(autoaugment.AUGMENTATIONS)))
+
+    def SetEpoch(self, epoch):
+        self.epoch = epoch
+
+    def __len__(self):
+        return len(self.filenames)
+
+    # Original + augmented variants of the index-th image, as a list of (image, boxes, names)
+    def __getitem__(self, index):
+        filename = self.filenames[index]
+        basefilename, image, et, boxes = autoaugment.LoadImage(filename, self.inputdir)
+        if image is None:
+            raise IOError("can't read " + self.inputdir + filename)
+        names = ObjectNames(et)
+
+        rng = random
+        if self.seed is not None:
+            rng = autoaugment.ImageRNG("%s:%d" % (self.seed, self.epoch), basefilename)
+
+        samples = []
+        if self.include_original:
+            samples.append((image, boxes, names))
+        for variant in autoaugment.AugmentImage(image, boxes, self.policy, 0.0, rng):
+            newextension, output, outboxes = variant[:3]
+            if outboxes is None: # photometric op, the boxes don't move
+                samples.append((output, boxes, names))
+            elif len(variant) == 4: # geometric op, only the kept objects remain
+                samples.append((output, outboxes, [names[i] for i in variant[3]]))
+            else:
+                samples.append((output, outboxes, names))
+        return samples
+
+    def __iter__(self):
+        for index in range(len(self)):
+            for sample in self[index]:
+                yield sample
+
+# Class names of the objects with a bndbox, in the same order as LoadAnnotation's boxes
+def ObjectNames(et):
+    if et is None: return []
+    return [box.findtext("name") for box in et.getroot().findall("object") if box.find("bndbox") is not None]
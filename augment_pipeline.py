@@ -0,0 +1,147 @@
+
+# Objective: Runs autoaugment over many images as a three stage producer/consumer pipeline
+#
+# read    thread pool, decodes images + parses annotations ahead into a bounded queue (read_queue)
+# augment process pool, the ops are CPU bound; at most augment_queue images are in flight
+# write   thread pool, encodes + writes the variants behind (write_queue bounds what waits)
+#
+# The queue depths cap how many decoded images / variants are held in memory at once.
+# cv2.imread / cv2.imwrite release the GIL, so the read and write threads overlap with each other
+# and with the augment processes. Each stage counts items and busy seconds for a throughput report.
+
+import os
+import time
+import queue
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import autoaugment
+from instrumentation import Progress, StageTimers
+
+log = logging.getLogger(__name__)
+
+# Items processed and time spent by one stage, shared by its threads
+class StageCounter:
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.failed = 0
+        self.busy = 0.0
+        self.lock = threading.Lock()
+
+    def Add(self, seconds, failed=False):
+        with self.lock:
+            self.items += 1
+            self.busy += seconds
+            if failed: self.failed += 1
+
+    def Report(self, wall):
+        rate = self.items / wall if wall > 0 else 0.0
+        return "%-8s %7d items %5d failed %8.1f items/s (wall) %8.2f s busy" % (self.name, self.items, self.failed, rate, self.busy)
+
+# Runs in the augment processes: returns (variants, seconds, stage timings). With a seed the image's RNG depends only on
+# the seed and its name, so the output doesn't depend on which process runs it
+def _Augment(image, boxes, names, prob, seed, basefilename):
+    start = time.perf_counter()
+    rng = autoaugment.ImageRNG(seed, basefilename) if seed is not None else autoaugment.random
+    outputs = autoaugment.AugmentImage(image, boxes, names, prob, rng)
+    return outputs, time.perf_counter() - start, autoaugment.timers.take()
+
+# Forked workers would start with a copy of the parent's timings (and maybe of a held lock)
+def _InitAugmentWorker():
+    autoaugment.timers = StageTimers()
+
+def _Reader(filenames, decoded, counter, progress):
+    while True:
+        try:
+            filename = filenames.get_nowait()
+        except queue.Empty:
+            break
+        start = time.perf_counter()
+        try:
+            basefilename, image, et, boxes = autoaugment.LoadImage(filename)
+            failed = image is None
+        except Exception as e:
+            log.error("Failed to read %s: %r", filename, e)
+            failed = True
+        counter.Add(time.perf_counter() - start, failed)
+        if failed:
+            progress.update() # done with this image, nothing reaches the writers
+        else:
+            decoded.put((basefilename, image, et, boxes)) # blocks while read_queue images are waiting
+    decoded.put(None) # this reader is done
+
+def _Writer(encoded, counter, xml_lock, progress):
+    while True:
+        item = encoded.get()
+        if item is None: break
+        basefilename, et, outputs = item
+        start = time.perf_counter()
+        failed = False
+        try:
+            autoaugment.WriteOutputs(basefilename, et, outputs, xml_lock)
+        except Exception as e:
+            log.error("Failed to write %s: %r", basefilename, e)
+            failed = True
+        counter.Add(time.perf_counter() - start, failed)
+        progress.update()
+
+# Augments [filenames] (in "Images/") with the ops in [names]; returns the stage counters.
+# Pass a [seed] for reproducible output (identical to RunOps with the same seed)
+def RunPipeline(filenames, names, _prob, read_workers=2, augment_workers=None, write_workers=4,
+                read_queue=16, augment_queue=None, write_queue=32, seed=None):
+
+    augment_workers = augment_workers or os.cpu_count()
+    augment_queue = augment_queue or 2 * augment_workers
+    counters = dict((stage, StageCounter(stage)) for stage in ("read", "augment", "write"))
+    started = time.perf_counter()
+
+    todo = queue.Queue()
+    for filename in filenames:
+        todo.put(filename)
+    decoded = queue.Queue(maxsize=read_queue)
+    encoded = queue.Queue(maxsize=write_queue)
+    # A shared sink (e.g. ShardedSink) isn't thread safe, plain xml files are
+    xml_lock = threading.Lock() if autoaugment.xml_sink is not None else None
+    progress = Progress(len(filenames), "autoaugment")
+
+    readers = [threading.Thread(target=_Reader, args=(todo, decoded, counters["read"], progress)) for _ in range(read_workers)]
+    writers = [threading.Thread(target=_Writer, args=(encoded, counters["write"], xml_lock, progress)) for _ in range(write_workers)]
+    for thread in readers + writers:
+        thread.start()
+
+    with ProcessPoolExecutor(max_workers=augment_workers, initializer=_InitAugmentWorker) as executor:
+        in_flight = deque() # (future, basefilename, et), oldest first
+        readers_done = 0
+        while readers_done < read_workers or in_flight:
+            if readers_done < read_workers and len(in_flight) < augment_queue:
+                item = decoded.get()
+                if item is None:
+                    readers_done += 1
+                    continue
+                basefilename, image, et, boxes = item
+                in_flight.append((executor.submit(_Augment, image, boxes, names, _prob, seed, basefilename), basefilename, et))
+                continue
+
+            future, basefilename, et = in_flight.popleft()
+            try:
+                outputs, seconds, timings = future.result()
+                counters["augment"].Add(seconds)
+                autoaugment.timers.merge(timings)
+                encoded.put((basefilename, et, outputs)) # blocks while write_queue results are waiting
+            except Exception as e:
+                log.error("Failed to augment %s: %r", basefilename, e)
+                counters["augment"].Add(0.0, True)
+                progress.update()
+
+    for _ in writers:
+        encoded.put(None)
+    for thread in readers + writers:
+        thread.join()
+
+    wall = time.perf_counter() - started
+    for stage in ("read", "augment", "write"):
+        log.info(counters[stage].Report(wall))
+    autoaugment.timers.report(log)
+    return counters
@@ -30,28 +30,28 @@ import cv2
 import xml.etree.ElementTree
 import sys
 import argparse
-import shutil
+import hashlib
+import copy
+import contextlib
+import logging
+from instrumentation import StageTimers, configure_logging, profiled, LOG_LEVELS
+from geometric import ApplyGeometric, AffineRotate90, AffineCrop
 
 # Adds salt and pepper noise to image using a probability value
-def AddNoise(image, prob):
-    output = np.zeros(image.shape,np.uint8)
+def AddNoise(image, prob, rng=random):
+    output = image.copy() # copy base values
     thres = 1 - prob 
-    for i in range(image.shape[0]): # x loop
-        for j in range(image.shape[1]): # y loop 
-            rdn = random.random()
-            if rdn < prob: # bottom threshold
-                output[i][j] = 0
-            elif rdn > thres: # top threshold
-                output[i][j] = 255
-            else: # copy base value
-                output[i][j] = image[i][j]
+    rdn = NumpyRNG(rng).random(image.shape[:2]) # one draw per pixel (all channels of a pixel share it)
+    output[rdn < prob] = 0 # bottom threshold
+    output[rdn > thres] = 255 # top threshold
     return output
 
 # Applies a Gaussian Blur to the specified image, repeated [loops] number of times
+# (in place after the first pass, one output image whatever the number of loops)
 def ApplyGaussianBlur(image, loops):
     output = cv2.GaussianBlur(image,(5,5),0)
     for i in range (loops - 1): 
-        output = cv2.GaussianBlur(output,(5,5),0)
+        cv2.GaussianBlur(output,(5,5),0,dst=output)
     return output
 
 def FlipVertical(image):
@@ -65,39 +65,25 @@ def FlipHorizontal(image):
 # uses defined boxes in annotated image and occludes parts of it scaling with occ_p
 def Occlude(image, file, occ_p):
 
-    if (not os.path.isfile("Images/" + file + ".xml")): return # skip (can't work on non-anotated images)
+    et, boxes = LoadAnnotation(file)
+    if (et is None): return # skip (can't work on non-anotated images)
 
-    # initialize output
-    output = np.zeros(image.shape,np.uint8)
+    return OccludeBoxes(image, boxes, occ_p)
 
-    # Open original XML file
-    et = xml.etree.ElementTree.parse("Images/" + file + ".xml")
-    root = et.getroot()
+# occludes parts of the (N, 4) xmin - ymin - xmax - ymax boxes, scaling with occ_p
+def OccludeBoxes(image, boxes, occ_p, rng=random):
 
-    # Collect all bounding box coordinates
-    allcoords = [] # xmin - ymin - xmax - ymax
     occludecoords = [] # the boxes we will occlude
-    allboxes = root.findall("object") # objects contain name - pose - truncated - difficult - bndbox
-    for box in allboxes:  # loop over objects
-        for element in list(box):
-            if element.tag == "bndbox": # the coords of the bndbox
-                for coords in list(element):
-                    allcoords.append(int(coords.text)) # store all the coordinates here
-
-    for i in range (0, int(len(allcoords)), 4): # loop 4 by 4 (for every bndbox)
-        xmin = allcoords[i] # unpack
-        ymin = allcoords[i + 1]
-        xmax = allcoords[i + 2]
-        ymax = allcoords[i + 3]
+    for xmin, ymin, xmax, ymax in boxes.tolist(): # for every bndbox
 
         desire_w = int((xmax - xmin) * occ_p - 1) # the desired w of occlusion box
         desire_h = int((ymax - ymin) * occ_p - 1) # the desired h of occlusion box
 
         # now choose xmin randomly so it fits in the bndbox
-        d_xmin = random.randrange(xmin, xmax - desire_w)
+        d_xmin = rng.randrange(xmin, xmax - desire_w)
         d_xmax = d_xmin + desire_w
         # now choose ymin randomly so it fits in the bndbox
-        d_ymin = random.randrange(ymin, ymax - desire_h)
+        d_ymin = rng.randrange(ymin, ymax - desire_h)
         d_ymax = d_ymin + desire_h
 
         # store in the occlude coords for a single pass along the image
@@ -107,9 +93,7 @@ def Occlude(image, file, occ_p):
         occludecoords.append(d_ymax)
 
     # copy base image
-    for i in range(image.shape[0]): # x loop
-            for j in range(image.shape[1]): # y loop 
-                    output[i][j] = image[i][j] # copy image first
+    output = image.copy()
     
     # occlude zones --> set pixels to white in the image
     for index in range (0, int(len(occludecoords)), 4):
@@ -119,14 +103,10 @@ def Occlude(image, file, occ_p):
 
 def DarkenLighten(image, _value):
 
-    # initialize output
-    output1 = np.zeros(image.shape, np.uint8)
-    output2 = np.zeros(image.shape, np.uint8)
-
-    for i in range(image.shape[0]): # x loop
-        for j in range(image.shape[1]): # y loop 
-            output1[i][j] = max(image[i][j] - _value, 0) # darkened version
-            output2[i][j] = min(image[i][j] + _value, 255) # darkened version
+    # saturating subtract / add as 256 entry lookup tables, no int16 copy of the image
+    values = np.arange(256)
+    output1 = cv2.LUT(image, np.clip(values - _value, 0, 255).astype(np.uint8)) # darkened version
+    output2 = cv2.LUT(image, np.clip(values + _value, 0, 255).astype(np.uint8)) # lightened version
 
     return output1, output2
 
@@ -140,110 +120,212 @@ def IsPointIn(x, y, coords, index):
     else : 
         return False
 
+# Registered augmentation ops, run in registration order. An op takes the decoded sample
+# {"image", "image_gs", "boxes", "height", "width", "rng"} (all random draws go through sample["rng"]) and returns a list of (newextension, image, boxes)
+# variants, boxes being None when the annotation is unchanged. Geometric ops return
+# (newextension, image, boxes, keep), keep being the indices of the objects that survived the transform.
+# New ops only need @Augmentation("name")
+AUGMENTATIONS = {}
+
+def Augmentation(name):
+    def register(op):
+        AUGMENTATIONS[name] = op
+        return op
+    return register
+
+@Augmentation("noise")
+def NoiseOp(sample):
+    return [("_noise_gs", AddNoise(sample["image_gs"], 0.05, sample["rng"]), None)] # applying to grayscale only here is more interesting
+
+@Augmentation("blur")
+def BlurOp(sample):
+    return [("_gblur", ApplyGaussianBlur(sample["image"], 4), None)] # second parameter defines number of blurs applied
+
+@Augmentation("flips")
+def FlipsOp(sample):
+    outputs = []
+    for newextension, image, fliporientation in (("_flip_v", FlipVertical(sample["image"]), 0), ("_flip_h", FlipHorizontal(sample["image"]), 1)):
+        boxes = None
+        if sample["boxes"] is not None: # adjust bndbox coordinates to match flip
+            boxes = FlipBoxes(sample["boxes"], fliporientation, sample["height"], sample["width"])
+        outputs.append((newextension, image, boxes))
+    return outputs
+
+@Augmentation("occlude")
+def OccludeOp(sample):
+    if sample["boxes"] is None: return [] # skip (can't work on non-anotated images)
+    return [("_occluded", OccludeBoxes(sample["image"], sample["boxes"], 0.15, sample["rng"]), None)]
+
+@Augmentation("darkenlighten")
+def DarkenLightenOp(sample):
+    darken, lighten = DarkenLighten(sample["image_gs"], 45)
+    return [("_darkened", darken, None), ("_lightened", lighten, None)]
+
+# Geometric ops from geometric.py: one affine matrix for the image and all boxes at once
+@Augmentation("rot90")
+def Rotate90Op(sample):
+    output, boxes, keep = ApplyGeometric(sample["image"], sample["boxes"], *AffineRotate90(1, sample["height"], sample["width"]))
+    return [("_rot90", output, boxes, keep)]
+
+@Augmentation("crop")
+def CropOp(sample, crop_p=0.8):
+    crop_w = int(sample["width"] * crop_p) # keep crop_p of each side, at a random position
+    crop_h = int(sample["height"] * crop_p)
+    x = sample["rng"].randrange(0, sample["width"] - crop_w + 1)
+    y = sample["rng"].randrange(0, sample["height"] - crop_h + 1)
+    output, boxes, keep = ApplyGeometric(sample["image"], sample["boxes"], *AffineCrop(x, y, crop_w, crop_h))
+    return [("_crop", output, boxes, keep)]
 
 # Runs all selected augmentation operations on initial dataset
-def RunAll(filename, noise, blur, flips, occlude, darkenlighten, _prob):
+# With a [seed] every image gets its own RNG derived from seed + file name (see ImageRNG), without one the global random module is used
+def RunAll(filename, noise, blur, flips, occlude, darkenlighten, _prob, seed=None):
+    enabled = {"noise": noise, "blur": blur, "flips": flips, "occlude": occlude, "darkenlighten": darkenlighten}
+    RunOps(filename, [name for name in AUGMENTATIONS if enabled.get(name)], _prob, seed)
 
-    inputdir = "Images/"
+# Decodes the image and parses its annotation once, fans the sample out to every op in [names]
+# and writes all the variants at the end
+def RunOps(filename, names, _prob, seed=None):
+    basefilename, image, et, boxes = LoadImage(filename)
+    rng = ImageRNG(seed, basefilename) if seed is not None else random
+    outputs = AugmentImage(image, boxes, names, _prob, rng)
+    WriteOutputs(basefilename, et, outputs)
+
+log = logging.getLogger(__name__)
+
+# Seconds spent per stage (decode, parse, transform:<op>, serialize, write) in this process,
+# augment_pipeline.py adds the timings of its augment processes
+timers = StageTimers()
+
+# Read stage: returns (basefilename, image, annotation tree, boxes), tree and boxes are None for un-annotated images
+def LoadImage(filename, inputdir="Images/"):
 
     basefilename = os.path.splitext(filename)[0] # name of the file without extension
-    image = cv2.imread(inputdir + filename) # with colours
-    image_gs = cv2.imread(inputdir + filename,0) # convert to grayscale
-    img_h = image.shape[0] # the height of the image
-    img_w = image.shape[1] # the width of the image
-
-    prob = _prob # copy variable
-
-    if (not os.path.isfile("Images/" + basefilename + ".xml")): 
-        prob = max(_prob - 0.05, 0.1) # lower augmentations for un-annotated images
-        #return # don't augment un-annotated images
-
-    # Noise
-    if noise and Roll(prob):
-        noise_img_gs = AddNoise(image_gs,0.05) # applying to grayscale only here is more interesting
-        cv2.imwrite(inputdir + basefilename + '_noise_gs.jpg', noise_img_gs) 
-        CreateXML(basefilename, '_noise_gs')
-
-    # Gaussian Blur
-    if blur and Roll(prob):
-        blur_img = ApplyGaussianBlur(image, 4) # second parameter defines number of blurs applied
-        cv2.imwrite(inputdir + basefilename + '_gblur.jpg', blur_img)
-        CreateXML(basefilename, "_gblur")
-
-    # Flips
-    if flips and Roll(prob):
-        flip_v = FlipVertical(image)
-        flip_h = FlipHorizontal(image)
-        cv2.imwrite(inputdir + basefilename + '_flip_v.jpg', flip_v)
-        cv2.imwrite(inputdir + basefilename + '_flip_h.jpg', flip_h)
-        CreateFlippedXML(basefilename, "_flip_v", 0, img_h, img_w) # adjust bndbox coordinates to match flip
-        CreateFlippedXML(basefilename, "_flip_h", 1, img_h, img_w) 
-
-    # Occlude
-    if occlude and Roll(prob):
-        occluded = Occlude(image, basefilename, 0.15)
-        if (occluded is not None):
-            cv2.imwrite(inputdir + basefilename + '_occluded.jpg', occluded)
-            CreateXML(basefilename, "_occluded")
-
-    # Darken / Lighten
-    if darkenlighten and Roll(prob):
-        darken, lighten = DarkenLighten(image_gs, 45)
-        cv2.imwrite(inputdir + basefilename + '_darkened.jpg', darken)
-        CreateXML(basefilename, "_darkened")
-        cv2.imwrite(inputdir + basefilename + '_lightened.jpg', lighten)
-        CreateXML(basefilename, "_lightened")
+    log.debug("Read image: %s", filename)
+    with timers.stage("decode"):
+        image = cv2.imread(inputdir + filename) # with colours
+    with timers.stage("parse"):
+        et, boxes = LoadAnnotation(basefilename, inputdir)
+    return basefilename, image, et, boxes
+
+# Augment stage: runs the ops in [names] on one decoded image, returns the list of variants.
+# [names] can also be a {name: probability} policy, overriding _prob per op (used as given,
+# the lower probability for un-annotated images only applies to _prob).
+# [rng] is the random.Random (or the random module) every Roll and op draws from
+def AugmentImage(image, boxes, names, _prob, rng=random):
+
+    image_gs = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) # convert to grayscale in memory, no second read
+    sample = {"image": image, "image_gs": image_gs, "boxes": boxes, "height": image.shape[0], "width": image.shape[1], "rng": rng}
+
+    outputs = []
+    for name in names:
+        if isinstance(names, dict):
+            prob = names[name] # explicit policy
+        else:
+            prob = _prob # copy variable
+
+            if (boxes is None): 
+                prob = max(prob - 0.05, 0.1) # lower augmentations for un-annotated images
+                #return # don't augment un-annotated images
+
+        if Roll(prob, rng):
+            with timers.stage("transform:" + name):
+                outputs.extend(AUGMENTATIONS[name](sample))
+    return outputs
+
+# Write stage: encodes every variant and writes its annotation. [xml_lock] serializes the
+# WriteXML calls when several threads share one xml_sink
+def WriteOutputs(basefilename, et, outputs, xml_lock=None):
 
-# Updates XML data using base XML annotated file in "Images/"
-def CreateXML(file, newextension):
+    inputdir = "Images/"
+
+    for variant in outputs:
+        newextension, output, outboxes = variant[:3]
+        with timers.stage("serialize"):
+            encoded = cv2.imencode('.jpg', output)[1] # same bytes cv2.imwrite would write
+        with timers.stage("write"):
+            encoded.tofile(inputdir + basefilename + newextension + '.jpg')
+        if (et is None): continue
+        with (xml_lock or contextlib.nullcontext()), timers.stage("write"):
+            if (len(variant) == 4): # geometric: objects may be dropped, the size may change
+                WriteXML(et, basefilename, newextension, outboxes, variant[3], (output.shape[1], output.shape[0]))
+            else:
+                WriteXML(et, basefilename, newextension, outboxes)
+
+# Parses "Images/<file>.xml" once, returns (tree, boxes) where boxes is a (N, 4) int array
+# of xmin - ymin - xmax - ymax, one row per object bndbox. (None, None) for un-annotated images
+def LoadAnnotation(file, inputdir="Images/"):
+
+    if (not os.path.isfile(inputdir + file + ".xml")): return None, None
+
+    et = xml.etree.ElementTree.parse(inputdir + file + ".xml")
+    allboxes = et.getroot().findall("object/bndbox") # objects contain name - pose - truncated - difficult - bndbox
+    boxes = [[int(bndbox.find(tag).text) for tag in BNDBOX_TAGS] for bndbox in allboxes]
+    return et, np.array(boxes, dtype=np.int32).reshape(-1, 4)
+
+BNDBOX_TAGS = ("xmin", "ymin", "xmax", "ymax")
+
+# When set to a sink from annotation_sink.py (e.g. ShardedSink("XML_shards/")), WriteXML puts the variant
+# annotations there instead of writing one small xml file each. Call xml_sink.close() after the run
+xml_sink = None
 
-    if (not os.path.isfile("Images/" + file + ".xml")): return # skip
+# Writes the annotation of a variant, with [boxes] replacing the bndbox coordinates when given.
+# With [keep] only those objects (indices into the original ones) are written, [size] (w, h) updates <size>.
+# The parsed tree is copied, so the same tree serves every variant
+def WriteXML(et, file, newextension, boxes=None, keep=None, size=None):
 
-    # Open original XML file
-    et = xml.etree.ElementTree.parse("Images/" + file + ".xml")
-    root = et.getroot()
+    root = copy.deepcopy(et.getroot())
 
     # Update Path
     currentpath = root.find("folder").text.split(file)[0] # get current path up to here
     currentpath +="\\"+ file + newextension + ".xml" # update to match what we want here
     root.find("folder").text = currentpath
 
-    et.write(os.path.join(currentpath)) # save
+    if keep is not None:
+        allobjects = [box for box in root.findall("object") if box.find("bndbox") is not None]
+        for index in sorted(set(range(len(allobjects))) - set(np.asarray(keep).tolist())):
+            root.remove(allobjects[index])
+
+    if size is not None and root.find("size") is not None:
+        root.find("size/width").text = str(size[0])
+        root.find("size/height").text = str(size[1])
+
+    if boxes is not None:
+        for bndbox, box in zip(root.findall("object/bndbox"), boxes.tolist()):
+            for tag, value in zip(BNDBOX_TAGS, box):
+                bndbox.find(tag).text = str(value)
+
+    if xml_sink is not None:
+        xml_sink.write(file + newextension + ".xml", xml.etree.ElementTree.tostring(root, encoding="unicode"))
+        return
+
+    xml.etree.ElementTree.ElementTree(root).write(os.path.join(currentpath)) # save
+
+# Mirrors (N, 4) boxes like cv2.flip: 0 vertical, 1 horizontal, 2 both
+def FlipBoxes(boxes, fliporientation, img_h, img_w):
+    output = boxes.copy()
+    if (fliporientation == 1 or fliporientation == 2): # horizontal flip
+        output[:, 0] = img_w - boxes[:, 2] - 1
+        output[:, 2] = img_w - boxes[:, 0] - 1
+    if (fliporientation == 0 or fliporientation == 2): # vertical flip
+        output[:, 1] = img_h - boxes[:, 3] - 1
+        output[:, 3] = img_h - boxes[:, 1] - 1
+    return output
 
 # Updates XML data using base XML annotated file in "Images/"
-def CreateFlippedXML(file, newextension, fliporientation, img_h, img_w):
-
-    if (not os.path.isfile("Images/" + file + ".xml")): return # skip
-
-    # Open original XML file
-    et = xml.etree.ElementTree.parse("Images/" + file + ".xml")
-    root = et.getroot()
+def CreateXML(file, newextension):
 
-    # Update path
-    currentpath = root.find("folder").text.split(file)[0] # get current path up to here
-    currentpath +="\\"+file  +newextension + ".xml" # update to match what we want here
-    root.find("folder").text = currentpath
+    et, boxes = LoadAnnotation(file)
+    if (et is None): return # skip
 
-    # Convert *.xml coordinates to *.txt format
-    allboxes = root.findall("object") # objects contain name - pose - truncated - difficult - bndbox
-    for box in allboxes:  # loop over objects
-        for element in list(box):
-            if element.tag == "bndbox": # the coords of the bndbox
-                bndbox = list(element)
+    WriteXML(et, file, newextension)
 
-                if (fliporientation == 1 or fliporientation == 2): # horizontal flip
-                    oldmin = bndbox[0].text
-                    oldmax = bndbox[2].text
-                    bndbox[0].text = str(img_w - int(oldmax) - 1)
-                    bndbox[2].text = str(img_w - int(oldmin) - 1)
+# Updates XML data using base XML annotated file in "Images/"
+def CreateFlippedXML(file, newextension, fliporientation, img_h, img_w):
 
-                if (fliporientation == 0 or fliporientation == 2): # vertical flip
-                    oldmin = bndbox[1].text
-                    oldmax = bndbox[3].text
-                    bndbox[1].text = str(img_h - int(oldmax) - 1)
-                    bndbox[3].text = str(img_h - int(oldmin) - 1)
+    et, boxes = LoadAnnotation(file)
+    if (et is None): return # skip
 
-    et.write(os.path.join(currentpath)) # save
+    WriteXML(et, file, newextension, FlipBoxes(boxes, fliporientation, img_h, img_w))
 
 def CheckIfImage(filename):
     if (filename.endswith(".png") or filename.endswith(".jpg") or filename.endswith(".bmp") or filename.endswith(".jpeg")
@@ -252,23 +334,45 @@ def CheckIfImage(filename):
     
     return False
 
-def Roll(_prob):
-    if (random.random() < _prob): return True
+# NumPy generator seeded from [rng] (the global random module by default), so seeding it still fixes whole-array draws
+def NumpyRNG(rng=random):
+    return np.random.default_rng(rng.getrandbits(64))
+
+# RNG of one image, seeded from the global seed and the file name only: the image gets the same
+# augmentations whatever order or process it runs in, so serial and parallel runs give the same files
+def ImageRNG(seed, basefilename):
+    digest = hashlib.sha256(("%s:%s" % (seed, basefilename)).encode("utf-8")).digest()
+    return random.Random(int.from_bytes(digest[:8], "big"))
+
+def Roll(_prob, rng=random):
+    if (rng.random() < _prob): return True
     return False
 
 # EXECUTE
 if __name__ == "__main__":
 
-    if not os.path.exists("Backup/"): # backup is used for rollback 
-        os.makedirs("Backup/")
-
-    for filename in os.listdir("Images/"):
-        shutil.copyfile("Images/" + filename, "Backup/" + filename) # save to backup before proceeding
-
-    for filename in os.listdir("Images/"): # where the annotated images should be
-        if CheckIfImage(filename): # check extensions
-            print("running on file " + filename)
-            RunAll(filename, True, True, True, False, True, 0.8) # Noise - Gaussian Blur - Flip Image - Occlude - Darken/Lighten
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seed", type=int, default=None, help="makes the augmentations reproducible (per image, independent of worker count)")
+    parser.add_argument("--log-level", default="INFO", choices=LOG_LEVELS, help="DEBUG also logs every image")
+    parser.add_argument("--timings-json", default=None, help="write the seconds spent per stage to this json file")
+    parser.add_argument("--profile", default=None, help="write cProfile stats of the run to this file")
+    args = parser.parse_args()
+    configure_logging(args.log_level)
+
+    # save to backup before proceeding: hardlinks + a manifest, undo with "python snapshot.py rollback"
+    from snapshot import TakeSnapshot
+    TakeSnapshot("Images/", "Backup/")
+
+    # Noise - Gaussian Blur - Flip Image - Darken/Lighten (no Occlude), images are read, augmented
+    # and written by overlapping stages (augment_pipeline.py)
+    from augment_pipeline import RunPipeline
+    filenames = [filename for filename in os.listdir("Images/") if CheckIfImage(filename)] # where the annotated images should be
+    log.info("running on %d files", len(filenames))
+    with profiled(args.profile):
+        RunPipeline(filenames, ["noise", "blur", "flips", "darkenlighten"], 0.8, seed=args.seed)
+    if args.timings_json is not None:
+        import autoaugment # the module the pipeline recorded into, this script runs as __main__
+        autoaugment.timers.dump_json(args.timings_json)
 
     if not os.path.exists("XML/"): # create a new XML folder
         os.makedirs("XML/")
@@ -0,0 +1,88 @@
+
+# Objective: Compares the per-pixel loop implementations of the autoaugment ops
+# with the whole-array versions in autoaugment.py on synthetic images
+#
+# How to use:
+# python benchmark_augment.py --width 640 --height 480 --repeat 3
+#
+# The loop versions are very slow (seconds per VGA frame), keep the size small
+
+import time
+import random
+import argparse
+import numpy as np
+import autoaugment
+
+# Reference implementations, as they were before vectorizing
+def AddNoiseLoop(image, prob):
+    output = np.zeros(image.shape,np.uint8)
+    thres = 1 - prob
+    for i in range(image.shape[0]): # x loop
+        for j in range(image.shape[1]): # y loop
+            rdn = random.random()
+            if rdn < prob: # bottom threshold
+                output[i][j] = 0
+            elif rdn > thres: # top threshold
+                output[i][j] = 255
+            else: # copy base value
+                output[i][j] = image[i][j]
+    return output
+
+def DarkenLightenLoop(image, _value):
+    output1 = np.zeros(image.shape, np.uint8)
+    output2 = np.zeros(image.shape, np.uint8)
+    for i in range(image.shape[0]): # x loop
+        for j in range(image.shape[1]): # y loop
+            output1[i][j] = max(int(image[i][j]) - _value, 0) # darkened version
+            output2[i][j] = min(int(image[i][j]) + _value, 255) # lightened version
+    return output1, output2
+
+def CopyLoop(image):
+    output = np.zeros(image.shape,np.uint8)
+    for i in range(image.shape[0]): # x loop
+        for j in range(image.shape[1]): # y loop
+            output[i][j] = image[i][j]
+    return output
+
+# Best of [repeat] runs, in seconds
+def Time(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+# EXECUTE
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--width", type=int, default=320)
+    parser.add_argument("--height", type=int, default=240)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, (args.height, args.width, 3), dtype=np.uint8)
+    image_gs = rng.integers(0, 256, (args.height, args.width), dtype=np.uint8)
+    pixels = args.width * args.height
+
+    # Sanity check: the vectorized versions must give the same pictures
+    loop_dark, loop_light = DarkenLightenLoop(image_gs, 45)
+    fast_dark, fast_light = autoaugment.DarkenLighten(image_gs, 45)
+    assert np.array_equal(loop_dark, fast_dark) and np.array_equal(loop_light, fast_light)
+    assert np.array_equal(CopyLoop(image), image.copy())
+
+    ops = [
+        ("AddNoise", lambda: AddNoiseLoop(image_gs, 0.05), lambda: autoaugment.AddNoise(image_gs, 0.05)),
+        ("DarkenLighten", lambda: DarkenLightenLoop(image_gs, 45), lambda: autoaugment.DarkenLighten(image_gs, 45)),
+        ("Occlude copy", lambda: CopyLoop(image), lambda: image.copy()),
+    ]
+
+    print("%dx%d, best of %d" % (args.width, args.height, args.repeat))
+    print("%-15s %15s %15s %10s" % ("op", "loop Mpx/s", "numpy Mpx/s", "speedup"))
+    for name, loop, fast in ops:
+        t_loop = Time(loop, args.repeat)
+        t_fast = Time(fast, args.repeat)
+        print("%-15s %15.3f %15.1f %9.0fx" % (name, pixels / t_loop / 1e6, pixels / t_fast / 1e6, t_loop / t_fast))
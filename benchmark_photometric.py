@@ -0,0 +1,95 @@
+
+# Objective: Memory and time per image of the photometric ops, one image at a time with the
+# allocating versions vs. a stack of images through photometric.PhotometricBatch
+#
+# How to use:
+# python benchmark_photometric.py --width 640 --height 480 --batch 32 --loops 4
+#
+# Memory is measured with tracemalloc (numpy and cv2 outputs are traced): the peak of new
+# allocations while one image / one batch is processed, reported per image. The batch buffers
+# themselves are allocated once before timing and reported separately
+
+import time
+import random
+import argparse
+import tracemalloc
+import numpy as np
+import cv2
+import autoaugment
+from photometric import PhotometricBatch
+
+# Reference implementations, as they were before the in-place / lookup table versions
+def ApplyGaussianBlurCopies(image, loops):
+    output = cv2.GaussianBlur(image,(5,5),0)
+    for i in range (loops - 1):
+        output = cv2.GaussianBlur(output,(5,5),0)
+    return output
+
+def DarkenLightenInt16(image, _value):
+    wide = image.astype(np.int16)
+    return np.clip(wide - _value, 0, 255).astype(np.uint8), np.clip(wide + _value, 0, 255).astype(np.uint8)
+
+def PerImage(images, loops, seed):
+    rng = random.Random(seed)
+    for image in images:
+        autoaugment.AddNoise(image, 0.05, rng)
+        ApplyGaussianBlurCopies(image, loops)
+        DarkenLightenInt16(image, 45)
+
+def Batched(batch, images, loops, seed):
+    rng = random.Random(seed)
+    batch.Fill(images)
+    batch.Noise(0.05, rng)
+    batch.Blur(loops)
+    batch.Brightness(-45)
+    batch.Brightness(45)
+
+# (seconds, peak MB of new allocations) of func()
+def Measure(func):
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    return elapsed, peak / 1e6
+
+# EXECUTE
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--batch", type=int, default=32)
+    parser.add_argument("--loops", type=int, default=4, help="gaussian blur passes")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    images = [rng.integers(0, 256, (args.height, args.width, 3), dtype=np.uint8) for _ in range(args.batch)]
+    batch = PhotometricBatch(images[0].shape, args.batch)
+    batch.Fill(images)
+
+    # Sanity check: same pictures as the per-image ops (blur within 1 grey level, see photometric.py)
+    noise_rng = random.Random(1)
+    expected = [autoaugment.AddNoise(image, 0.05, noise_rng) for image in images]
+    assert all(np.array_equal(a, b) for a, b in zip(expected, batch.Noise(0.05, random.Random(1))))
+    darken, lighten = DarkenLightenInt16(images[0], 45)
+    assert np.array_equal(autoaugment.DarkenLighten(images[0], 45)[0], darken)
+    assert np.array_equal(batch.Brightness(-45)[0], darken) and np.array_equal(batch.Brightness(45)[0], lighten)
+    assert np.array_equal(autoaugment.ApplyGaussianBlur(images[0], args.loops), ApplyGaussianBlurCopies(images[0], args.loops))
+    blur_diff = max(int(np.abs(batch.Blur(args.loops)[i].astype(np.int16) - ApplyGaussianBlurCopies(images[i], args.loops)).max())
+                    for i in range(len(images)))
+    assert blur_diff <= 1, blur_diff
+
+    # One image at a time: the peak is reached inside a single image, so measure one image per call
+    per_image = [Measure(lambda: PerImage([image], args.loops, 0)) for image in images]
+    batched = Measure(lambda: Batched(batch, images, args.loops, 0))
+
+    n = len(images)
+    buffers = (batch.images.nbytes + batch.output.nbytes + batch.draws.nbytes + batch.mask.nbytes) / 1e6
+    print("%dx%d, %d images, noise + %d blurs + darken/lighten" % (args.width, args.height, n, args.loops))
+    print("%-12s %12s %22s" % ("", "ms/image", "peak new MB/image"))
+    print("%-12s %12.2f %22.2f" % ("per image", 1e3 * sum(t for t, _ in per_image) / n, max(mb for _, mb in per_image)))
+    print("%-12s %12.2f %22.2f" % ("batched", 1e3 * batched[0] / n, batched[1] / n))
+    print("batch buffers (allocated once): %.1f MB, blur max difference: %d grey level(s)" % (buffers, blur_diff))
@@ -0,0 +1,215 @@
+
+# Objective: End-to-end throughput of the yolo -> voc conversion and of the autoaugment ops
+# on a synthetic dataset, so slowdowns show up as numbers instead of going unnoticed
+#
+# How to use:
+# python benchmark_pipeline.py --images 500 --width 640 --height 480 --boxes 10 --classes 2 --json run.json
+# python benchmark_pipeline.py --baseline run.json   (prints the ratio of every stage to an earlier run)
+#
+# The dataset is generated into a temporary folder (deleted afterwards unless --keep is given):
+#   images/  <n>.jpg, smooth gradients with the boxes drawn in
+#   labels/  <n>.txt yolo labels, class ids in [0, classes)
+# Stages, each reported as seconds, images/sec, boxes/sec and the peak RSS reached so far:
+#   classes      YOLO2VOCConvert.search_all_classes
+#   convert      label read + size probe + xml formatting of every pair, into memory (ListSink)
+#   xml_write    writing the converted xmls to a folder
+#   yolo2voc     YOLO2VOCConvert.yolo2voc end to end (--workers processes)
+#   decode       autoaugment.LoadImage (jpg decode + xml parse)
+#   op:<name>    every registered autoaugment op, on every decoded image
+#   encode       jpg encoding of all the variants the ops produced (images/sec counts variants)
+# The converters only log (nothing is configured here), so no console output is timed
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import tempfile
+import argparse
+import contextlib
+import cv2
+import numpy as np
+import autoaugment
+from annotation_sink import ListSink, XMLDirectorySink
+from instrumentation import StageTimers
+from YOLO_To_VOC_Converter import YOLO2VOCConvert
+
+try:
+    import resource
+except ImportError: # not available on windows, peak RSS is reported as None there
+    resource = None
+
+# Writes [images] jpgs of width x height with [boxes] yolo boxes each, classes drawn from [0, classes)
+def GenerateDataset(root, images, width, height, boxes, classes, seed=0):
+    rng = np.random.default_rng(seed)
+    imgs_path = os.path.join(root, "images")
+    txts_path = os.path.join(root, "labels")
+    os.makedirs(imgs_path)
+    os.makedirs(txts_path)
+
+    gradient = np.add.outer(np.linspace(0, 160, height), np.linspace(0, 80, width)).astype(np.uint8)
+    for i in range(images):
+        image = np.dstack([gradient, np.roll(gradient, i, axis=1), gradient[::-1]])
+        box_w = rng.uniform(0.05, 0.5, boxes)
+        box_h = rng.uniform(0.05, 0.5, boxes)
+        x_center = rng.uniform(box_w / 2, 1 - box_w / 2)
+        y_center = rng.uniform(box_h / 2, 1 - box_h / 2)
+        class_ids = rng.integers(0, classes, boxes)
+        for cx, cy, w, h in zip(x_center, y_center, box_w, box_h):
+            cv2.rectangle(image, (int((cx - w / 2) * width), int((cy - h / 2) * height)),
+                          (int((cx + w / 2) * width), int((cy + h / 2) * height)), (255, 255, 255), 2)
+        cv2.imwrite(os.path.join(imgs_path, "%07d.jpg" % i), image)
+        with open(os.path.join(txts_path, "%07d.txt" % i), "w") as f:
+            for row in zip(class_ids, x_center, y_center, box_w, box_h):
+                f.write("%d %.6f %.6f %.6f %.6f\n" % row)
+    return imgs_path, txts_path
+
+# Peak resident memory in MB of this process and of its (finished) pool workers
+def PeakRSS():
+    if resource is None:
+        return None, None
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024 # ru_maxrss is bytes on macOS, KB on linux
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale)
+
+# instrumentation.StageTimers plus the images, boxes and peak RSS of every stage
+class StageTimer:
+    def __init__(self, images, boxes):
+        self.images = images
+        self.boxes = boxes
+        self.timers = StageTimers()
+        self.counts = {} # stage -> {"images", "boxes", "peak_rss_mb", "peak_rss_workers_mb"}
+
+    # Times the body of the with block as stage [name]
+    @contextlib.contextmanager
+    def Stage(self, name, images=None, boxes=None):
+        with self.timers.stage(name):
+            yield
+        self.Count(name, images, boxes)
+
+    # Adds [seconds] to stage [name], a stage recorded several times is reported as the sum
+    def Record(self, name, seconds, images=None, boxes=None):
+        self.timers.add(name, seconds)
+        self.Count(name, images, boxes)
+
+    def Count(self, name, images=None, boxes=None):
+        counts = self.counts.setdefault(name, {"images": 0, "boxes": 0})
+        counts["images"] += self.images if images is None else images
+        counts["boxes"] += self.boxes if boxes is None else boxes
+        counts["peak_rss_mb"], counts["peak_rss_workers_mb"] = PeakRSS()
+
+    # {stage: {"seconds", "calls", "images", "boxes", "images_per_sec", "boxes_per_sec", "peak_rss_mb", "peak_rss_workers_mb"}}
+    def Results(self):
+        stages = self.timers.as_dict()
+        for name, stage in stages.items():
+            stage.update(self.counts[name])
+            stage["images_per_sec"] = stage["images"] / stage["seconds"]
+            stage["boxes_per_sec"] = stage["boxes"] / stage["seconds"]
+        return stages
+
+    def Report(self):
+        print("%-16s %11s %16s %18s %13s" % ("stage", "seconds", "img/s", "boxes/s", "peak RSS"))
+        for name, stage in self.Results().items():
+            rss = stage["peak_rss_mb"]
+            print("%-16s %9.3f s %12.1f img/s %14.1f boxes/s %10s MB" % (name, stage["seconds"], stage["images_per_sec"],
+                                                                       stage["boxes_per_sec"], "%.1f" % rss if rss is not None else "-"))
+
+def RunConversion(timer, imgs_path, txts_path, xmls_path, classes, workers):
+    converter = YOLO2VOCConvert(txts_path, xmls_path, imgs_path, sink=ListSink())
+    converter.classes = ["class%d" % i for i in range(classes)]
+    pairs = sorted((name, os.path.splitext(name)[0] + ".txt") for name in os.listdir(imgs_path))
+
+    with timer.Stage("classes"):
+        converter.search_all_classes()
+    with timer.Stage("convert"):
+        converter.convert_pairs(pairs)
+    xml_sink = XMLDirectorySink(xmls_path)
+    os.makedirs(xmls_path)
+    with timer.Stage("xml_write"):
+        for name, text in converter.sink.items:
+            xml_sink.write(name, text)
+
+    shutil.rmtree(xmls_path)
+    converter = YOLO2VOCConvert(txts_path, xmls_path, imgs_path)
+    converter.classes = ["class%d" % i for i in range(classes)]
+    with timer.Stage("yolo2voc"):
+        summary = converter.yolo2voc(workers=workers)
+    assert summary["failed"] == 0, summary["errors"]
+
+def RunAugmentations(timer, imgs_path, xmls_path, seed):
+    # LoadImage reads the picture and its xml from one folder
+    for name in os.listdir(xmls_path):
+        shutil.copyfile(os.path.join(xmls_path, name), os.path.join(imgs_path, name))
+    filenames = sorted(name for name in os.listdir(imgs_path) if autoaugment.CheckIfImage(name))
+
+    samples = []
+    with timer.Stage("decode"):
+        for filename in filenames:
+            basefilename, image, et, boxes = autoaugment.LoadImage(filename, imgs_path + "/")
+            samples.append((image, boxes))
+
+    for name, op in autoaugment.AUGMENTATIONS.items():
+        rng = random.Random(seed)
+        outputs = []
+        with timer.Stage("op:" + name):
+            for image, boxes in samples:
+                image_gs = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) # as AugmentImage builds the sample
+                outputs.extend(op({"image": image, "image_gs": image_gs, "boxes": boxes,
+                                   "height": image.shape[0], "width": image.shape[1], "rng": rng}))
+
+        # encoded op by op, so only one op's variants are held in memory
+        start = time.perf_counter()
+        for output in outputs:
+            cv2.imencode(".jpg", output[1])
+        timer.Record("encode", time.perf_counter() - start, images=len(outputs), boxes=0)
+
+# Ratio of every stage's time to the same stage of an earlier --json run (> 1 means slower now)
+def CompareWithBaseline(stages, baseline_path):
+    with open(baseline_path, "r") as f:
+        baseline = json.load(f)["stages"]
+    print("%-16s %12s %12s %8s" % ("stage", "baseline s", "now s", "ratio"))
+    for name, stage in stages.items():
+        if name in baseline:
+            print("%-16s %12.3f %12.3f %7.2fx" % (name, baseline[name]["seconds"], stage["seconds"], stage["seconds"] / baseline[name]["seconds"]))
+
+# EXECUTE
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=200)
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--boxes", type=int, default=10, help="boxes per image")
+    parser.add_argument("--classes", type=int, default=2)
+    parser.add_argument("--workers", type=int, default=1, help="processes for the yolo2voc stage")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-augment", action="store_true")
+    parser.add_argument("--json", default=None, help="write the results to this json file")
+    parser.add_argument("--baseline", default=None, help="json file of an earlier run to compare with")
+    parser.add_argument("--keep", action="store_true", help="keep the generated dataset")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="benchmark_pipeline_")
+    try:
+        start = time.perf_counter()
+        imgs_path, txts_path = GenerateDataset(root, args.images, args.width, args.height, args.boxes, args.classes, args.seed)
+        xmls_path = os.path.join(root, "xmls")
+        print("generated %d images (%dx%d, %d boxes, %d classes) in %.1f s, %s"
+              % (args.images, args.width, args.height, args.boxes, args.classes, time.perf_counter() - start, root))
+
+        timer = StageTimer(args.images, args.images * args.boxes)
+        RunConversion(timer, imgs_path, txts_path, xmls_path, args.classes, args.workers)
+        if not args.skip_augment:
+            RunAugmentations(timer, imgs_path, xmls_path, args.seed)
+        timer.Report()
+    finally:
+        if not args.keep:
+            shutil.rmtree(root)
+
+    stages = timer.Results()
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump({"config": vars(args), "stages": stages}, f, indent=2)
+    if args.baseline is not None:
+        CompareWithBaseline(stages, args.baseline)
@@ -0,0 +1,58 @@
+
+# Objective: Compares the xml.dom.minidom Document writer with the template writer of voc_xml.py
+#
+# How to use:
+# python benchmark_voc_xml.py --files 2000 --objects 20
+#
+# Both writers are first checked to give the same bytes (including escaping and empty annotations),
+# then timed writing into memory, reported as objects/sec
+
+import io
+import time
+import random
+import argparse
+from voc_xml import format_voc_xml, build_voc_document
+
+def MinidomWriter(folder_text, filename_text, width_img, height_img, depth_img, objects):
+    f = io.StringIO()
+    xmlBuilder = build_voc_document(folder_text, filename_text, width_img, height_img, depth_img, objects)
+    xmlBuilder.writexml(f, indent='\t', newl='\n', addindent='\t', encoding='utf-8')
+    return f.getvalue()
+
+def TemplateWriter(folder_text, filename_text, width_img, height_img, depth_img, objects):
+    return format_voc_xml(folder_text, filename_text, width_img, height_img, depth_img, objects)
+
+def RandomAnnotation(objects_count):
+    width_img, height_img = random.randint(100, 4000), random.randint(100, 4000)
+    objects = []
+    for _ in range(objects_count):
+        xmin, ymin = random.randint(0, width_img - 1), random.randint(0, height_img - 1)
+        objects.append((random.choice(["person", "car"]), xmin, ymin, random.randint(xmin, width_img), random.randint(ymin, height_img)))
+    return "JPEGImages", "%06d.jpg" % random.randint(0, 999999), width_img, height_img, 3, objects
+
+# EXECUTE
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--objects", type=int, default=20)
+    args = parser.parse_args()
+
+    random.seed(0)
+
+    # Golden check: same text for a plain, an empty and an escaped annotation
+    golden = [RandomAnnotation(args.objects), RandomAnnotation(0),
+              ("a&b <c>", 'quote".jpg', 10, 20, 3, [("car & \"bus\"", 1, 2, 3, 4)])]
+    for annotation in golden:
+        assert MinidomWriter(*annotation) == TemplateWriter(*annotation), annotation
+
+    annotations = [RandomAnnotation(args.objects) for _ in range(args.files)]
+    objects = args.files * args.objects
+
+    print("%d files, %d objects each" % (args.files, args.objects))
+    for name, writer in (("minidom", MinidomWriter), ("template", TemplateWriter)):
+        start = time.perf_counter()
+        for annotation in annotations:
+            writer(*annotation)
+        elapsed = time.perf_counter() - start
+        print("%-10s %12.0f objects/sec %10.0f files/sec" % (name, objects / elapsed, args.files / elapsed))
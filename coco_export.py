@@ -0,0 +1,131 @@
+import os
+import json
+import shutil
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from dataset_index import pair_images_labels
+from yolo_labels import read_yolo_labels
+
+'''
+COCO json export of a yolo dataset (the inputs of a YOLO2VOCConvert: pictures, labels, classes).
+
+Nothing is held in memory per image: every chunk of (picture, label) pairs is written to two partial
+files in <json_path>.parts/ (one json object per line for "images" and for "annotations"), by a pool
+worker or in process, and the partial files are streamed into the final json at the end.
+Image ids follow the sorted pair order, annotation ids are given while merging, category ids are
+the class index + 1 (COCO reserves 0).
+'''
+
+WRITE_BUFFER_BYTES = 1 << 20
+
+
+# COCO [x, y, width, height] boxes in pixels and their areas, for all boxes of one picture at once
+def yolo_to_coco_boxes(boxes, width_img, height_img):
+    box_w = boxes[:, 3] * width_img
+    box_h = boxes[:, 4] * height_img
+    x = boxes[:, 1] * width_img - box_w / 2
+    y = boxes[:, 2] * height_img - box_h / 2
+    bboxes = np.round(np.stack([x, y, box_w, box_h], axis=1), 2)
+    return bboxes, np.round(box_w * box_h, 2)
+
+
+# Converter used by the current pool worker process, set once by _init_worker
+_worker_converter = None
+
+
+def _init_worker(converter):
+    global _worker_converter
+    _worker_converter = converter
+
+
+def _export_worker_chunk(task):
+    return _export_chunk(_worker_converter, task)
+
+
+# Writes part-<n>.images / part-<n>.annotations for one chunk. Annotation lines are written without
+# their opening "{" so the merge can prepend '{"id": <id>, ' without parsing them again.
+# Returns (annotations written, [(txt_name, error)], picture sizes probed in this chunk)
+def _export_chunk(converter, task):
+    part_index, first_image_id, pairs, parts_dir = task
+    annotations = 0
+    errors = []
+    images_file = open(os.path.join(parts_dir, 'part-%06d.images' % part_index), 'w', buffering=WRITE_BUFFER_BYTES)
+    annotations_file = open(os.path.join(parts_dir, 'part-%06d.annotations' % part_index), 'w', buffering=WRITE_BUFFER_BYTES)
+    for image_id, (img_name, txt_name) in enumerate(pairs, first_image_id):
+        try:
+            height_img, width_img, depth_img = converter.size_cache.get(os.path.join(converter.imgs_path, img_name))
+            boxes = read_yolo_labels(os.path.join(converter.txts_path, txt_name), dtype=np.float64)
+            class_ids = boxes[:, 0].astype(np.int64)
+            if len(class_ids) and (class_ids.min() < 0 or class_ids.max() >= len(converter.classes)):
+                raise ValueError("class id out of range of %d classes" % len(converter.classes))
+            bboxes, areas = yolo_to_coco_boxes(boxes, width_img, height_img)
+        except Exception as e:
+            errors.append((txt_name, repr(e)))
+            continue
+        images_file.write(json.dumps({'id': image_id, 'file_name': img_name, 'width': width_img, 'height': height_img}) + '\n')
+        for class_id, bbox, area in zip(class_ids.tolist(), bboxes.tolist(), areas.tolist()):
+            annotation = {'image_id': image_id, 'category_id': class_id + 1, 'bbox': bbox, 'area': area, 'iscrowd': 0}
+            annotations_file.write(json.dumps(annotation)[1:] + '\n')
+        annotations += len(class_ids)
+    images_file.close()
+    annotations_file.close()
+    return annotations, errors, converter.size_cache.take_updates()
+
+
+# Streams the partial files of every chunk into one json array, the image lines as they are,
+# the annotation lines with their id prepended. Returns the next annotation id
+def _merge_parts(out, parts_dir, part_count, suffix, next_id=None):
+    first = True
+    for part_index in range(part_count):
+        with open(os.path.join(parts_dir, 'part-%06d.%s' % (part_index, suffix)), 'r') as f:
+            for line in f:
+                if not first:
+                    out.write(',\n')
+                first = False
+                if next_id is None:
+                    out.write(line[:-1])
+                else:
+                    out.write('{"id": %d, %s' % (next_id, line[:-1]))
+                    next_id += 1
+    return next_id
+
+
+# Export the pictures/labels of a YOLO2VOCConvert to one COCO json file.
+# Returns a summary {'images', 'annotations', 'failed', 'errors', 'orphan_images', 'orphan_labels'}
+def export_coco(converter, json_path, workers=1, chunk_size=256, recursive=False):
+    pairs, orphan_imgs, orphan_txts, duplicates = pair_images_labels(converter.imgs_path, converter.txts_path, recursive)
+
+    parts_dir = json_path + '.parts'
+    if os.path.exists(parts_dir):
+        shutil.rmtree(parts_dir)
+    os.makedirs(parts_dir)
+
+    # Image ids are fixed up front from the pair order, so every chunk can be written independently
+    tasks = [(part_index, first + 1, pairs[first:first + chunk_size], parts_dir)
+             for part_index, first in enumerate(range(0, len(pairs), chunk_size))]
+    if workers <= 1:
+        results = [_export_chunk(converter, task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(converter,)) as executor:
+            results = list(executor.map(_export_worker_chunk, tasks))
+
+    summary = {'images': 0, 'annotations': 0, 'failed': 0, 'errors': [], 'orphan_images': orphan_imgs, 'orphan_labels': orphan_txts}
+    for annotations, errors, sizes in results:
+        summary['annotations'] += annotations
+        summary['errors'].extend(errors)
+        converter.size_cache.update(sizes)
+    summary['failed'] = len(summary['errors'])
+    summary['images'] = len(pairs) - summary['failed']
+    converter.size_cache.save()
+
+    categories = [{'id': class_id + 1, 'name': name, 'supercategory': 'none'} for class_id, name in enumerate(converter.classes)]
+    tmp_path = json_path + '.tmp'
+    with open(tmp_path, 'w', buffering=WRITE_BUFFER_BYTES) as out:
+        out.write('{"images": [\n')
+        _merge_parts(out, parts_dir, len(tasks), 'images')
+        out.write('\n],\n"annotations": [\n')
+        _merge_parts(out, parts_dir, len(tasks), 'annotations', next_id=1)
+        out.write('\n],\n"categories": %s}\n' % json.dumps(categories))
+    os.replace(tmp_path, json_path)
+    shutil.rmtree(parts_dir)
+    return summary
@@ -0,0 +1,69 @@
+import os
+import json
+
+'''
+Manifest of a yolo2voc run, used to reconvert only what changed since the last run.
+
+For every converted label it stores {txt_name: {"label", "image", "output", "signature"}},
+where the signature is the (mtime_ns, size) of the label file and of the picture.
+A settings dict (class names, picture folder, xml folder) is stored too, if it changes every xml
+would come out different or be written elsewhere, so nothing is reused.
+'''
+
+
+def source_signature(img_file, txt_file):
+    txt_st = os.stat(txt_file)
+    img_st = os.stat(img_file)
+    return [txt_st.st_mtime_ns, txt_st.st_size, img_st.st_mtime_ns, img_st.st_size]
+
+
+class ConversionManifest:
+    def __init__(self, manifest_path, settings):
+        self.manifest_path = manifest_path
+        self.settings = settings
+        self.entries = {}
+        if os.path.isfile(manifest_path):
+            with open(manifest_path, 'r') as f:
+                try:
+                    saved = json.load(f)
+                except ValueError:
+                    saved = {}  # corrupt manifest, convert everything again
+            if saved.get('settings') == settings:
+                self.entries = saved.get('entries', {})
+
+    # Split the current (picture, txt) pairs into the ones that need converting and the ones that are up to date
+    def changed_pairs(self, pairs, imgs_path, txts_path):
+        changed = []
+        skipped = 0
+        for img_name, txt_name in pairs:
+            entry = self.entries.get(txt_name)
+            if (entry is not None and entry['image'] == os.path.join(imgs_path, img_name)
+                    and entry['signature'] == source_signature(entry['image'], os.path.join(txts_path, txt_name))
+                    and os.path.isfile(entry['output'])):
+                skipped += 1
+            else:
+                changed.append((img_name, txt_name))
+        return changed, skipped
+
+    # Delete the xml of every label that is no longer in pairs, returns how many were removed
+    def remove_vanished(self, pairs):
+        current = set(txt_name for img_name, txt_name in pairs)
+        removed = 0
+        for txt_name in [txt_name for txt_name in self.entries if txt_name not in current]:
+            output = self.entries.pop(txt_name)['output']
+            if os.path.isfile(output):
+                os.remove(output)
+            removed += 1
+        return removed
+
+    def record(self, txt_name, img_file, txt_file, output_file, signature):
+        self.entries[txt_name] = {'label': txt_file, 'image': img_file, 'output': output_file, 'signature': signature}
+
+    def forget(self, txt_name):
+        self.entries.pop(txt_name, None)
+
+    def save(self):
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'settings': self.settings, 'entries': self.entries}, f)
+        os.replace(tmp_path, self.manifest_path)  # never leave a half written manifest behind
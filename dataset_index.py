@@ -0,0 +1,63 @@
+import os
+from yolo_labels import is_label_file
+
+'''
+Pairs pictures with their yolo label files by file name stem ("0002030.jpg" <-> "0002030.txt").
+
+Each folder is scanned once with os.scandir into a {stem: name} dict, so pairing is one dict
+lookup per label instead of relying on two os.listdir results lining up. With recursive=True
+sub folders are scanned too and the stem keeps its relative path ("train/0002030").
+'''
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp'}
+
+
+# {stem: relative file name} of the files in root_path accepted by keep(name, extension),
+# plus the sorted names of the files sharing a stem (e.g. 0001.jpg and 0001.png). A shared stem is
+# left out of the index altogether: which file would win depends on the directory order
+def index_files(root_path, keep, recursive=False):
+    names = {}
+    pending = ['']
+    while pending:
+        relative_dir = pending.pop()
+        with os.scandir(os.path.join(root_path, relative_dir)) as entries:
+            for entry in entries:
+                name = os.path.join(relative_dir, entry.name) if relative_dir else entry.name
+                if entry.is_dir():
+                    if recursive:
+                        pending.append(name)
+                    continue
+                stem, extension = os.path.splitext(name)
+                if not keep(entry.name, extension.lower()):
+                    continue
+                names.setdefault(stem, []).append(name)
+    index = dict((stem, found[0]) for stem, found in names.items() if len(found) == 1)
+    duplicates = sorted(name for found in names.values() if len(found) > 1 for name in found)
+    return index, duplicates
+
+
+def is_image_file(name, extension):
+    return extension in IMAGE_EXTENSIONS
+
+
+def is_label_entry(name, extension):
+    return extension == '.txt' and is_label_file(name)
+
+
+# Returns (pairs, orphan images, orphan labels, duplicates), pairs being [(img_name, txt_name)] sorted by stem.
+# Orphans are pictures without a label and labels without a picture. Duplicates are the files of every
+# ambiguous stem (shared by two pictures or two labels), including the partner on the other side;
+# none of those are converted
+def pair_images_labels(imgs_path, txts_path, recursive=False):
+    imgs, img_duplicates = index_files(imgs_path, is_image_file, recursive)
+    txts, txt_duplicates = index_files(txts_path, is_label_entry, recursive)
+
+    ambiguous = set(os.path.splitext(name)[0] for name in img_duplicates + txt_duplicates)
+    partners = [files[stem] for files in (imgs, txts) for stem in ambiguous if stem in files]
+    imgs = dict((stem, name) for stem, name in imgs.items() if stem not in ambiguous)
+    txts = dict((stem, name) for stem, name in txts.items() if stem not in ambiguous)
+
+    pairs = [(imgs[stem], txts[stem]) for stem in sorted(txts) if stem in imgs]
+    orphan_imgs = sorted(imgs[stem] for stem in imgs if stem not in txts)
+    orphan_txts = sorted(txts[stem] for stem in txts if stem not in imgs)
+    return pairs, orphan_imgs, orphan_txts, sorted(img_duplicates + txt_duplicates + partners)
@@ -0,0 +1,98 @@
+
+# Objective: Geometric augmentations applied to the image and all of its boxes at once
+#
+# Every transform is a 2x3 affine matrix M in pixel coordinates ((x, y) -> M @ (x, y, 1)) plus the
+# output size. Steps are chained with ComposeAffine, the boxes ((N, 4) xmin - ymin - xmax - ymax)
+# go through the matrix as one array, and the pixels through one cv2 call:
+# cv2.flip / cv2.rotate when the matrix is an exact flip or 90 degree rotation, cv2.warpAffine otherwise.
+#
+# Pixel convention matches FlipBoxes in autoaugment.py: a horizontal flip maps x to w - x - 1
+
+import numpy as np
+import cv2
+
+def Identity(img_h, img_w):
+    return np.array([[1, 0, 0], [0, 1, 0]], dtype=np.float64), img_w, img_h
+
+# fliporientation like cv2.flip: 0 vertical, 1 horizontal, -1 both
+def AffineFlip(fliporientation, img_h, img_w):
+    M, out_w, out_h = Identity(img_h, img_w)
+    if fliporientation in (1, -1): # horizontal flip
+        M[0] = [-1, 0, img_w - 1]
+    if fliporientation in (0, -1): # vertical flip
+        M[1] = [0, -1, img_h - 1]
+    return M, out_w, out_h
+
+# k quarter turns clockwise
+def AffineRotate90(k, img_h, img_w):
+    k = k % 4
+    if k == 0:
+        return Identity(img_h, img_w)
+    if k == 1: # (x, y) -> (h - 1 - y, x)
+        return np.array([[0, -1, img_h - 1], [1, 0, 0]], dtype=np.float64), img_h, img_w
+    if k == 2: # (x, y) -> (w - 1 - x, h - 1 - y)
+        return np.array([[-1, 0, img_w - 1], [0, -1, img_h - 1]], dtype=np.float64), img_w, img_h
+    # (x, y) -> (y, w - 1 - x)
+    return np.array([[0, 1, 0], [-1, 0, img_w - 1]], dtype=np.float64), img_h, img_w
+
+# Resize by [scale], pixel centres stay aligned the way cv2.resize does it
+def AffineScale(scale, img_h, img_w):
+    offset = 0.5 * scale - 0.5
+    M = np.array([[scale, 0, offset], [0, scale, offset]], dtype=np.float64)
+    return M, int(round(img_w * scale)), int(round(img_h * scale))
+
+# Keep the [crop_w] x [crop_h] window starting at (x, y)
+def AffineCrop(x, y, crop_w, crop_h):
+    return np.array([[1, 0, -x], [0, 1, -y]], dtype=np.float64), crop_w, crop_h
+
+# Shift the content by (tx, ty), the image keeps its size
+def AffineTranslate(tx, ty, img_h, img_w):
+    return np.array([[1, 0, tx], [0, 1, ty]], dtype=np.float64), img_w, img_h
+
+# Chain steps built for the output size of the previous one, e.g.
+# ComposeAffine(AffineRotate90(1, h, w), AffineScale(0.5, w, h)): first rotate, then scale
+def ComposeAffine(*steps):
+    total = np.eye(3)
+    out_w, out_h = None, None
+    for M, out_w, out_h in steps:
+        total = np.vstack([M, [0, 0, 1]]) @ total
+    return total[:2], out_w, out_h
+
+# Moves all boxes through M at once: the 4 corners of every box are transformed, the new box is their envelope,
+# clipped to the output image. Boxes smaller than min_size pixels on a side are dropped.
+# Returns (boxes, keep) with keep the indices of the input boxes still present
+def TransformBoxes(boxes, M, out_w, out_h, min_size=1):
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    xmin, ymin, xmax, ymax = boxes.T
+    corners_x = np.stack([xmin, xmax, xmin, xmax], axis=1) # (N, 4)
+    corners_y = np.stack([ymin, ymin, ymax, ymax], axis=1)
+    new_x = M[0, 0] * corners_x + M[0, 1] * corners_y + M[0, 2]
+    new_y = M[1, 0] * corners_x + M[1, 1] * corners_y + M[1, 2]
+
+    output = np.stack([new_x.min(axis=1), new_y.min(axis=1), new_x.max(axis=1), new_y.max(axis=1)], axis=1)
+    output[:, [0, 2]] = np.clip(output[:, [0, 2]], 0, out_w - 1)
+    output[:, [1, 3]] = np.clip(output[:, [1, 3]], 0, out_h - 1)
+    output = np.rint(output).astype(np.int32)
+
+    keep = np.flatnonzero((output[:, 2] - output[:, 0] >= min_size) & (output[:, 3] - output[:, 1] >= min_size))
+    return output[keep], keep
+
+# Exact integer flips / quarter turns go through cv2.flip / cv2.rotate (no interpolation), anything else through cv2.warpAffine
+def TransformImage(image, M, out_w, out_h, border=0):
+    for k, rotate in ((1, cv2.ROTATE_90_CLOCKWISE), (2, cv2.ROTATE_180), (3, cv2.ROTATE_90_COUNTERCLOCKWISE)):
+        if np.array_equal(M, AffineRotate90(k, image.shape[0], image.shape[1])[0]):
+            return cv2.rotate(image, rotate)
+    for fliporientation in (0, 1):
+        if np.array_equal(M, AffineFlip(fliporientation, image.shape[0], image.shape[1])[0]):
+            return cv2.flip(image, fliporientation)
+    if np.array_equal(M, Identity(image.shape[0], image.shape[1])[0]) and (out_w, out_h) == (image.shape[1], image.shape[0]):
+        return image.copy()
+    return cv2.warpAffine(image, M, (out_w, out_h), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT, borderValue=border)
+
+# Applies one composed transform to the image and its boxes, returns (image, boxes, keep)
+def ApplyGeometric(image, boxes, M, out_w, out_h, min_size=1):
+    output = TransformImage(image, M, out_w, out_h)
+    if boxes is None:
+        return output, None, None
+    boxes, keep = TransformBoxes(boxes, M, out_w, out_h, min_size)
+    return output, boxes, keep
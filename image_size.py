@@ -0,0 +1,171 @@
+import os
+import json
+import struct
+import cv2
+
+'''
+Read the (height, width, depth) of a picture without decoding its pixels.
+
+yolo2voc only needs img.shape for the <size> tag, so instead of cv2.imread we read the
+first few KB of the file and parse the JPEG SOF / PNG IHDR / BMP info header.
+Unknown formats (or headers we can't make sense of) fall back to a full cv2.imread decode.
+'''
+
+PROBE_BYTES = 64 * 1024  # JPEG SOF usually sits behind EXIF/ICC segments, read a bit more than one block
+
+# cv2.imread(path) uses IMREAD_COLOR, which always decodes to 3 channel BGR, so the depth
+# written into the xml has always been 3 regardless of what the file header says
+DECODED_DEPTH = 3
+
+# SOFn markers carry the frame size, 0xC4 (DHT), 0xC8 (JPG) and 0xCC (DAC) are not frames
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+# EXIF orientation 5..8 means the picture is stored rotated by 90 degrees,
+# cv2.imread applies it, so width and height have to be swapped to match img.shape
+def _exif_orientation(segment):
+    if segment[:6] != b'Exif\x00\x00':
+        return 1
+    tiff = segment[6:]
+    if tiff[:2] == b'II':
+        endian = '<'
+    elif tiff[:2] == b'MM':
+        endian = '>'
+    else:
+        return 1
+    try:
+        ifd_offset = struct.unpack(endian + 'I', tiff[4:8])[0]
+        entries = struct.unpack(endian + 'H', tiff[ifd_offset:ifd_offset + 2])[0]
+        for i in range(entries):
+            entry = ifd_offset + 2 + i * 12
+            tag, = struct.unpack(endian + 'H', tiff[entry:entry + 2])
+            if tag == 0x0112:  # Orientation
+                return struct.unpack(endian + 'H', tiff[entry + 8:entry + 10])[0]
+    except struct.error:
+        pass
+    return 1
+
+
+def _jpeg_size(f, head):
+    pos = 2  # skip SOI (FFD8)
+    orientation = 1
+    while True:
+        # Make sure the marker and its 2 byte length are in the buffer, pull more of the file if not
+        while len(head) < pos + 4:
+            more = f.read(PROBE_BYTES)
+            if not more:
+                return None
+            head += more
+        if head[pos] != 0xFF:
+            return None
+        marker = head[pos + 1]
+        if marker == 0xFF:  # fill byte
+            pos += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:  # standalone markers, no length
+            pos += 2
+            continue
+        length, = struct.unpack('>H', head[pos + 2:pos + 4])
+        while len(head) < pos + 2 + length:
+            more = f.read(PROBE_BYTES)
+            if not more:
+                return None
+            head += more
+        if marker == 0xE1 and orientation == 1:
+            orientation = _exif_orientation(head[pos + 4:pos + 2 + length])
+        elif marker in JPEG_SOF_MARKERS:
+            # precision(1) height(2) width(2) components(1)
+            height, width = struct.unpack('>HH', head[pos + 5:pos + 9])
+            if orientation in (5, 6, 7, 8):
+                height, width = width, height
+            return height, width
+        elif marker == 0xDA:  # start of scan without a frame header
+            return None
+        pos += 2 + length
+
+
+def _png_size(head):
+    # 8 byte signature, then the IHDR chunk: length(4) 'IHDR'(4) width(4) height(4)
+    if len(head) < 24 or head[12:16] != b'IHDR':
+        return None
+    width, height = struct.unpack('>II', head[16:24])
+    return height, width
+
+
+def _bmp_size(head):
+    if len(head) < 26:
+        return None
+    header_size, = struct.unpack('<I', head[14:18])
+    if header_size == 12:  # OS/2 BITMAPCOREHEADER uses 16 bit fields
+        width, height = struct.unpack('<HH', head[18:22])
+    else:
+        width, height = struct.unpack('<ii', head[18:26])
+    return abs(height), width  # negative height means a top-down bitmap
+
+
+# Returns (height, width, depth) in the same order as cv2.imread(path).shape, or None if the file can't be read
+def probe_image_size(path):
+    with open(path, 'rb') as f:
+        head = f.read(PROBE_BYTES)
+        size = None
+        if head[:2] == b'\xff\xd8':
+            size = _jpeg_size(f, head)
+        elif head[:8] == b'\x89PNG\r\n\x1a\n':
+            size = _png_size(head)
+        elif head[:2] == b'BM':
+            size = _bmp_size(head)
+    if size is not None and size[0] > 0 and size[1] > 0:
+        return size[0], size[1], DECODED_DEPTH
+
+    # Unknown format, decode the whole picture
+    img = cv2.imread(path)
+    if img is None:
+        return None
+    return img.shape
+
+
+class ImageSizeCache:
+    # Persistent {path: [mtime_ns, file_size, height, width, depth]} map saved as json,
+    # an entry is only reused while the picture's mtime and byte size are unchanged
+    def __init__(self, cache_path=None):
+        self.cache_path = cache_path
+        self.entries = {}
+        self.updated = {}  # entries probed since the last take_updates(), handed back by worker processes
+        self.dirty = False
+        if cache_path is not None and os.path.isfile(cache_path):
+            with open(cache_path, 'r') as f:
+                try:
+                    self.entries = json.load(f)
+                except ValueError:
+                    self.entries = {}  # corrupt cache, just probe everything again
+
+    def get(self, path):
+        st = os.stat(path)
+        key = os.path.abspath(path)
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+            return tuple(entry[2:])
+
+        shape = probe_image_size(path)
+        if shape is not None:
+            self.entries[key] = self.updated[key] = [st.st_mtime_ns, st.st_size] + list(shape)
+            self.dirty = True
+        return shape
+
+    def take_updates(self):
+        updated, self.updated = self.updated, {}
+        return updated
+
+    def update(self, entries):
+        if entries:
+            self.entries.update(entries)
+            self.dirty = True
+
+    def save(self):
+        if self.cache_path is None or not self.dirty:
+            return
+        tmp_path = self.cache_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.cache_path)  # never leave a half written cache behind
+        self.dirty = False
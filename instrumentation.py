@@ -0,0 +1,136 @@
+import sys
+import json
+import time
+import logging
+import threading
+import contextlib
+
+'''
+Logging, progress and per-stage timing for the converters and autoaugment.
+
+Per-file messages go to the module loggers at DEBUG, summaries at INFO and failures at ERROR,
+so a run over millions of files doesn't spend its time writing to stdout. configure_logging()
+sets the level for the scripts (--log-level).
+
+StageTimers adds up the seconds and calls of named stages (decode, parse, transform, serialize, write):
+
+    timers = StageTimers()
+    with timers.stage('parse'):
+        ...
+    timers.report()                 # one INFO line per stage
+    timers.dump_json('timings.json')
+
+Pool workers hand their timings back with take() and the parent adds them with merge(),
+the same way ImageSizeCache hands back probed sizes. Progress logs done/total, rate and ETA
+at most every interval seconds, and profiled() runs a block under cProfile.
+'''
+
+log = logging.getLogger(__name__)
+
+LOG_LEVELS = ['DEBUG', 'INFO', 'WARNING', 'ERROR']
+
+
+def configure_logging(level='INFO', stream=None):
+    logging.basicConfig(level=getattr(logging, level.upper()), stream=stream or sys.stdout, format='%(message)s')
+
+
+class StageTimers:
+    # {stage: [seconds, calls]}, safe to share between threads
+    def __init__(self):
+        self.stages = {}
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds, calls=1):
+        with self.lock:
+            entry = self.stages.setdefault(name, [0.0, 0])
+            entry[0] += seconds
+            entry[1] += calls
+
+    # Converters holding timers are sent to pool workers, the lock can't be pickled
+    def __getstate__(self):
+        return self.as_dict()
+
+    def __setstate__(self, state):
+        self.__init__()
+        for name, stage in state.items():
+            self.add(name, stage['seconds'], stage['calls'])
+
+    # Timings since the last take(), handed back by worker processes
+    def take(self):
+        with self.lock:
+            stages, self.stages = self.stages, {}
+        return stages
+
+    def merge(self, stages):
+        for name, (seconds, calls) in stages.items():
+            self.add(name, seconds, calls)
+
+    def as_dict(self):
+        with self.lock:
+            return dict((name, {'seconds': seconds, 'calls': calls}) for name, (seconds, calls) in self.stages.items())
+
+    def report(self, logger=log):
+        for name, stage in sorted(self.as_dict().items(), key=lambda item: -item[1]['seconds']):
+            logger.info("%-24s %10.3f s %10d calls %10.1f us/call", name, stage['seconds'], stage['calls'],
+                        1e6 * stage['seconds'] / stage['calls'] if stage['calls'] else 0.0)
+
+    def dump_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.as_dict(), f, indent=2)
+
+
+class Progress:
+    # Logs "<label>: done/total (percent) rate/s, ETA" every interval seconds and once at the end
+    def __init__(self, total, label, interval=5.0, logger=log):
+        self.total = total
+        self.label = label
+        self.interval = interval
+        self.logger = logger
+        self.done = 0
+        self.started = self.last = time.perf_counter()
+        self.lock = threading.Lock()
+
+    def update(self, count=1):
+        with self.lock:
+            self.done += count
+            now = time.perf_counter()
+            if now - self.last < self.interval and self.done < self.total:
+                return
+            self.last = now
+            elapsed = now - self.started
+            rate = self.done / elapsed if elapsed > 0 else 0.0
+            eta = (self.total - self.done) / rate if rate > 0 else 0.0
+            self.logger.info("%s: %d/%d (%.1f%%) %.1f/s, ETA %s", self.label, self.done, self.total,
+                             100.0 * self.done / self.total if self.total else 100.0, rate, format_seconds(eta))
+
+
+def format_seconds(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return "%d:%02d:%02d" % (hours, minutes, seconds)
+
+
+# Runs the with block under cProfile and saves the stats to path (view with python -m pstats path).
+# Only this process is profiled, pool workers show up as the time spent waiting for them
+@contextlib.contextmanager
+def profiled(path=None):
+    if path is None:
+        yield
+        return
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        log.info("profile written to %s", path)
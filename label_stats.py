@@ -0,0 +1,162 @@
+import os
+import logging
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from yolo_labels import is_label_file, read_yolo_labels
+
+'''
+One pass over all yolo label files: statistics and validation, without converting anything.
+
+Files are read in chunks (over a process pool when workers > 1), the boxes of a chunk are checked
+together as one array, and every chunk returns fixed size histograms plus counts, so the result
+doesn't grow with the dataset. Only the first max_locations (txt_name, row) locations of each
+problem are kept, rows being 1-based box numbers in the file.
+
+Problems checked per box:
+    bad_class      class id not an integer or outside [0, num_classes)
+    out_of_range   x_center, y_center, width or height outside [0, 1]
+    zero_size      width or height <= 0
+    outside_image  box reaching over the picture border (center -/+ half size outside [0, 1])
+    duplicate      same 5 values as an earlier box of the same file
+and per file:
+    unreadable     a line without exactly 5 values, or values that aren't numbers
+'''
+
+PROBLEMS = ['bad_class', 'out_of_range', 'zero_size', 'outside_image', 'duplicate', 'unreadable']
+
+SIZE_BINS = np.linspace(0, 1, 21)  # relative width / height, 0.05 steps
+ASPECT_BINS = np.concatenate([[0], 2.0 ** np.arange(-5, 6), [np.inf]])  # relative width / height, powers of 2
+BOX_COUNT_BINS = np.array([0, 1, 2, 5, 10, 20, 50, 100, 200, 500, np.inf])  # boxes per file
+
+log = logging.getLogger(__name__)
+
+
+def empty_stats(num_classes):
+    return {
+        'files': 0,
+        'boxes': 0,
+        'class_counts': np.zeros(num_classes, np.int64),
+        'class_id_counts': {},  # {class id: boxes} of every integer id, also the ones outside [0, num_classes)
+        'width_hist': np.zeros(len(SIZE_BINS) - 1, np.int64),
+        'height_hist': np.zeros(len(SIZE_BINS) - 1, np.int64),
+        'aspect_hist': np.zeros(len(ASPECT_BINS) - 1, np.int64),
+        'boxes_per_file_hist': np.zeros(len(BOX_COUNT_BINS) - 1, np.int64),
+        'problems': dict((problem, 0) for problem in PROBLEMS),
+        'locations': dict((problem, []) for problem in PROBLEMS),
+    }
+
+
+def merge_stats(total, part, max_locations):
+    for key in ('files', 'boxes', 'class_counts', 'width_hist', 'height_hist', 'aspect_hist', 'boxes_per_file_hist'):
+        total[key] = total[key] + part[key]
+    for class_id, count in part['class_id_counts'].items():
+        total['class_id_counts'][class_id] = total['class_id_counts'].get(class_id, 0) + count
+    for problem in PROBLEMS:
+        total['problems'][problem] += part['problems'][problem]
+        room = max_locations - len(total['locations'][problem])
+        total['locations'][problem].extend(part['locations'][problem][:max(room, 0)])
+    return total
+
+
+def _flag(stats, problem, mask, names, file_index, rows, max_locations):
+    hits = np.flatnonzero(mask)
+    stats['problems'][problem] += len(hits)
+    for i in hits[:max_locations].tolist():
+        stats['locations'][problem].append((names[file_index[i]], int(rows[i]) + 1))
+
+
+# Statistics of one chunk of label files, all boxes of the chunk checked as one array
+def scan_chunk(txts_path, txt_names, num_classes, max_locations=100):
+    stats = empty_stats(num_classes)
+    parts = []
+    file_index = []
+    for i, txt_name in enumerate(txt_names):
+        try:
+            boxes = read_yolo_labels(os.path.join(txts_path, txt_name), dtype=np.float64)
+        except ValueError:
+            stats['problems']['unreadable'] += 1
+            if len(stats['locations']['unreadable']) < max_locations:
+                stats['locations']['unreadable'].append((txt_name, 0))
+            continue
+        stats['files'] += 1
+        parts.append(boxes)
+        file_index.append(np.full(len(boxes), i, np.int64))
+    if not parts:
+        return stats
+
+    boxes = np.concatenate(parts)
+    file_index = np.concatenate(file_index)
+    rows = np.concatenate([np.arange(len(part)) for part in parts])
+    counts = np.array([len(part) for part in parts])
+    stats['boxes'] = len(boxes)
+    stats['boxes_per_file_hist'] += np.histogram(counts, BOX_COUNT_BINS)[0]
+
+    class_ids, cx, cy, w, h = boxes.T
+    bad_class = (class_ids != np.floor(class_ids)) | (class_ids < 0) | (class_ids >= num_classes)
+    out_of_range = ((boxes[:, 1:] < 0) | (boxes[:, 1:] > 1)).any(axis=1)
+    zero_size = (w <= 0) | (h <= 0)
+    outside_image = ~out_of_range & ((cx - w / 2 < 0) | (cx + w / 2 > 1) | (cy - h / 2 < 0) | (cy + h / 2 > 1))
+
+    # Duplicates: sort the (file, values) rows, a row equal to the one before it is a repeat
+    keyed = np.column_stack([file_index, boxes])
+    order = np.lexsort(keyed.T[::-1])
+    repeated = np.zeros(len(boxes), bool)
+    repeated[order[1:]] = (keyed[order[1:]] == keyed[order[:-1]]).all(axis=1)
+
+    for problem, mask in (('bad_class', bad_class), ('out_of_range', out_of_range), ('zero_size', zero_size),
+                          ('outside_image', outside_image), ('duplicate', repeated)):
+        _flag(stats, problem, mask, txt_names, file_index, rows, max_locations)
+
+    integer_ids, id_counts = np.unique(class_ids[class_ids == np.floor(class_ids)].astype(np.int64), return_counts=True)
+    stats['class_id_counts'] = dict(zip(integer_ids.tolist(), id_counts.tolist()))
+    valid_class = ~bad_class
+    stats['class_counts'] += np.bincount(class_ids[valid_class].astype(np.int64), minlength=num_classes)[:num_classes]
+    stats['width_hist'] += np.histogram(np.clip(w, 0, 1), SIZE_BINS)[0]
+    stats['height_hist'] += np.histogram(np.clip(h, 0, 1), SIZE_BINS)[0]
+    positive = ~zero_size
+    stats['aspect_hist'] += np.histogram(w[positive] / h[positive], ASPECT_BINS)[0]
+    return stats
+
+
+def _scan_task(task):
+    return scan_chunk(*task)
+
+
+# Scan every label file of txts_path once, returns the merged statistics (see empty_stats)
+def scan_labels(txts_path, num_classes, workers=1, chunk_size=256, max_locations=100):
+    txt_names = sorted(txt for txt in os.listdir(txts_path) if is_label_file(txt))
+    tasks = [(txts_path, txt_names[i:i + chunk_size], num_classes, max_locations) for i in range(0, len(txt_names), chunk_size)]
+    if workers <= 1:
+        results = map(_scan_task, tasks)
+        return _merge_all(results, num_classes, max_locations)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return _merge_all(executor.map(_scan_task, tasks), num_classes, max_locations)
+
+
+def _merge_all(results, num_classes, max_locations):
+    total = empty_stats(num_classes)
+    for part in results:
+        merge_stats(total, part, max_locations)
+    return total
+
+
+def _print_hist(title, hist, bins, fmt):
+    log.info(title)
+    for count, low, high in zip(hist.tolist(), bins[:-1].tolist(), bins[1:].tolist()):
+        if count:
+            log.info("    [" + fmt % low + ", " + fmt % high + ")  %d", count)
+
+
+# The report goes to the module logger: statistics at INFO, problems found at WARNING
+def print_report(stats, classes):
+    log.info("Files: %d, boxes: %d", stats['files'], stats['boxes'])
+    log.info("Boxes per class:")
+    for name, count in zip(classes, stats['class_counts'].tolist()):
+        log.info("    %-20s %d", name, count)
+    _print_hist("Relative box width:", stats['width_hist'], SIZE_BINS, "%.2f")
+    _print_hist("Relative box height:", stats['height_hist'], SIZE_BINS, "%.2f")
+    _print_hist("Aspect ratio (relative width / height):", stats['aspect_hist'], ASPECT_BINS, "%.3g")
+    _print_hist("Boxes per file:", stats['boxes_per_file_hist'], BOX_COUNT_BINS, "%g")
+    for problem in PROBLEMS:
+        if stats['problems'][problem]:
+            log.warning("%s: %d, e.g. %s", problem, stats['problems'][problem], stats['locations'][problem][:5])
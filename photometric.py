@@ -0,0 +1,98 @@
+
+# Objective: Photometric augmentations for a stack of same-sized images, without per-image allocations
+#
+# PhotometricBatch preallocates its input stack, output stack and scratch buffers once for
+# (batch_size, height, width[, channels]) and every op writes into them through the dst= / out=
+# arguments of cv2 and numpy, so running a batch allocates (almost) nothing per image:
+#
+#   batch = PhotometricBatch((480, 640, 3), 32)
+#   images = batch.Fill(decoded)           # copies into the input stack, returns the filled part
+#   darkened = batch.Brightness(-45)       # view of the output stack, valid until the next op
+#
+# Per pixel value ops (brightness, contrast, gamma, darken / lighten) are one cv2.LUT over a
+# 256 entry table. Repeated 5x5 Gaussian blurs are collapsed into one pass of the equivalent
+# (4 * loops + 1) tap separable kernel, the 5 tap kernel convolved with itself loops times
+# (within 1 grey level of blurring loops times: the repeated blur rounds to uint8 after every pass)
+#
+# The outputs of an op share the output stack with the next op, copy or encode them first
+
+import random
+import numpy as np
+import cv2
+from autoaugment import NumpyRNG
+
+BLUR_KERNEL = cv2.getGaussianKernel(5, 0)[:, 0] # the kernel of cv2.GaussianBlur(image, (5, 5), 0)
+
+# Table adding [delta] with saturation, as DarkenLighten does
+def BrightnessLUT(delta):
+    return np.clip(np.arange(256) + delta, 0, 255).astype(np.uint8)
+
+# Table for alpha * (value - center) + center + beta, rounded and saturated
+def ContrastLUT(alpha, beta=0, center=128):
+    return np.clip(np.rint(alpha * (np.arange(256) - center) + center + beta), 0, 255).astype(np.uint8)
+
+# Table for 255 * (value / 255) ** gamma, gamma < 1 lightens, > 1 darkens
+def GammaLUT(gamma):
+    return np.clip(np.rint(255.0 * (np.arange(256) / 255.0) ** gamma), 0, 255).astype(np.uint8)
+
+# 1-D kernel of [loops] 5x5 blurs in a row: BLUR_KERNEL convolved with itself, 4 * loops + 1 taps
+def CollapsedBlurKernel(loops):
+    kernel = BLUR_KERNEL
+    for _ in range(loops - 1):
+        kernel = np.convolve(kernel, BLUR_KERNEL)
+    return kernel
+
+class PhotometricBatch:
+    def __init__(self, shape, batch_size):
+        self.shape = tuple(shape) # (height, width) or (height, width, channels)
+        self.images = np.empty((batch_size,) + self.shape, np.uint8) # input stack
+        self.output = np.empty_like(self.images) # output stack, shared by all ops
+        self.draws = np.empty(self.shape[:2], np.float64) # noise draws, one per pixel
+        self.mask = np.empty(self.shape[:2], np.bool_)
+        self.count = 0 # images in the stack
+        self.kernels = {} # loops -> collapsed blur kernel
+
+    # Copies [images] (all of self.shape) into the input stack, returns the filled part of it
+    def Fill(self, images):
+        if len(images) > len(self.images):
+            raise ValueError("batch holds %d images, got %d" % (len(self.images), len(images)))
+        for i, image in enumerate(images):
+            if image.shape != self.shape:
+                raise ValueError("image %d has shape %s, the batch %s" % (i, image.shape, self.shape))
+            np.copyto(self.images[i], image)
+        self.count = len(images)
+        return self.images[:self.count]
+
+    def ApplyLUT(self, table):
+        for i in range(self.count):
+            cv2.LUT(self.images[i], table, dst=self.output[i])
+        return self.output[:self.count]
+
+    def Brightness(self, delta):
+        return self.ApplyLUT(BrightnessLUT(delta))
+
+    def Contrast(self, alpha, beta=0):
+        return self.ApplyLUT(ContrastLUT(alpha, beta))
+
+    def Gamma(self, gamma):
+        return self.ApplyLUT(GammaLUT(gamma))
+
+    # Same result (within 1 grey level) as autoaugment.ApplyGaussianBlur(image, loops) on every image
+    def Blur(self, loops):
+        if loops not in self.kernels:
+            self.kernels[loops] = CollapsedBlurKernel(loops)
+        kernel = self.kernels[loops]
+        for i in range(self.count):
+            cv2.sepFilter2D(self.images[i], -1, kernel, kernel, dst=self.output[i])
+        return self.output[:self.count]
+
+    # Same pictures as calling autoaugment.AddNoise(image, prob, rng) on the images in order
+    def Noise(self, prob, rng=random):
+        thres = 1 - prob
+        for i in range(self.count):
+            output = self.output[i]
+            np.copyto(output, self.images[i]) # copy base values
+            NumpyRNG(rng).random(out=self.draws) # one draw per pixel (all channels of a pixel share it)
+            output[np.less(self.draws, prob, out=self.mask)] = 0 # bottom threshold
+            output[np.greater(self.draws, thres, out=self.mask)] = 255 # top threshold
+        return self.output[:self.count]
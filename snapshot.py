@@ -0,0 +1,127 @@
+
+# Objective: Cheap backup / rollback of the "Images" folder around an autoaugment run
+#
+# TakeSnapshot records a manifest (name, size, mtime) of every file in Images/ and puts a reflink
+# of each one in Backup/ (copy-on-write: shared data blocks until either side is written), so a backup
+# costs metadata operations instead of copying every byte. Where the file system has no reflinks
+# a hardlink is used, then a plain copy as the last resort. A hardlinked backup is the same file as
+# the original: it survives the original being deleted or replaced, not being edited in place.
+#
+# Rollback puts Images/ back the way the manifest recorded it: generated variants are deleted,
+# XMLs moved to XML/ are moved back, anything missing or changed is restored from Backup/.
+# A backup that no longer matches the manifest (a hardlink whose original was edited) is
+# reported as unusable and left alone.
+#
+# How to use:
+# python snapshot.py snapshot
+# python snapshot.py rollback
+
+import os
+import sys
+import json
+import shutil
+import logging
+from instrumentation import configure_logging
+
+MANIFEST = "manifest.json"
+FICLONE = 0x40049409 # linux ioctl, shares the data blocks of a file (btrfs, xfs, ...)
+
+log = logging.getLogger(__name__)
+
+# Reflink, else hardlink, else copy. Returns which one was used
+def LinkOrCopy(source, destination):
+    if os.path.lexists(destination):
+        os.remove(destination)
+    try:
+        import fcntl
+        with open(source, "rb") as src, open(destination, "wb") as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        shutil.copystat(source, destination) # keeps the mtime the manifest records
+        return "reflink"
+    except (OSError, ImportError):
+        if os.path.lexists(destination):
+            os.remove(destination) # empty file left by the failed clone
+    try:
+        os.link(source, destination)
+        return "link"
+    except OSError:
+        shutil.copy2(source, destination)
+        return "copy"
+
+def TakeSnapshot(inputdir="Images/", backupdir="Backup/"):
+
+    if not os.path.exists(backupdir): # backup is used for rollback
+        os.makedirs(backupdir)
+
+    files = {}
+    used = {"link": 0, "reflink": 0, "copy": 0}
+    for entry in os.scandir(inputdir):
+        if not entry.is_file(): continue
+        st = entry.stat()
+        files[entry.name] = [st.st_size, st.st_mtime_ns]
+        used[LinkOrCopy(os.path.join(inputdir, entry.name), os.path.join(backupdir, entry.name))] += 1
+
+    # Backup files of an older snapshot that aren't part of this one
+    for filename in os.listdir(backupdir):
+        if filename != MANIFEST and filename not in files:
+            os.remove(os.path.join(backupdir, filename))
+
+    tmp_path = os.path.join(backupdir, MANIFEST + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump({"inputdir": inputdir, "files": files}, f)
+    os.replace(tmp_path, os.path.join(backupdir, MANIFEST))
+
+    log.info("snapshot of %d files: %d reflinks, %d hardlinks, %d copies", len(files), used["reflink"], used["link"], used["copy"])
+    return files
+
+def Rollback(inputdir="Images/", backupdir="Backup/", xmldir="XML/"):
+
+    with open(os.path.join(backupdir, MANIFEST), "r") as f:
+        files = json.load(f)["files"]
+
+    deleted = moved = restored = unusable = 0
+
+    # XMLs moved out by autoaugment: originals go back, generated ones are deleted
+    if os.path.isdir(xmldir):
+        for filename in os.listdir(xmldir):
+            if filename in files and not os.path.exists(os.path.join(inputdir, filename)):
+                os.replace(os.path.join(xmldir, filename), os.path.join(inputdir, filename))
+                moved += 1
+            elif filename not in files:
+                os.remove(os.path.join(xmldir, filename))
+                deleted += 1
+
+    # Generated variants
+    for filename in os.listdir(inputdir):
+        if filename not in files and os.path.isfile(os.path.join(inputdir, filename)):
+            os.remove(os.path.join(inputdir, filename))
+            deleted += 1
+
+    # Originals that are missing or were changed
+    for filename, (size, mtime_ns) in files.items():
+        path = os.path.join(inputdir, filename)
+        if os.path.isfile(path):
+            st = os.stat(path)
+            if st.st_size == size and st.st_mtime_ns == mtime_ns: continue
+        backup = os.path.join(backupdir, filename)
+        if not os.path.isfile(backup) or os.stat(backup).st_size != size or os.stat(backup).st_mtime_ns != mtime_ns:
+            log.error("%s can't be restored: the backup changed since the snapshot (hardlink edited in place?)", filename)
+            unusable += 1
+            continue
+        LinkOrCopy(backup, path)
+        restored += 1
+
+    log.info("rollback: %d generated files deleted, %d XMLs moved back, %d originals restored, %d unusable backups", deleted, moved, restored, unusable)
+
+# EXECUTE
+if __name__ == "__main__":
+
+    if len(sys.argv) != 2 or sys.argv[1] not in ("snapshot", "rollback"):
+        print("usage: python snapshot.py snapshot|rollback")
+        sys.exit(1)
+    configure_logging()
+
+    if sys.argv[1] == "snapshot":
+        TakeSnapshot()
+    else:
+        Rollback()
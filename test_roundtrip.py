@@ -0,0 +1,50 @@
+
+# Objective: YOLO -> VOC -> YOLO keeps every box within one pixel and every class id unchanged
+#
+# How to use:
+# python -m pytest test_roundtrip.py
+# python test_roundtrip.py          (same check without pytest)
+
+import os
+import tempfile
+import numpy as np
+from benchmark_pipeline import GenerateDataset
+from yolo_labels import read_yolo_labels, is_label_file
+from YOLO_To_VOC_Converter import YOLO2VOCConvert
+from VOC_To_YOLO_Converter import VOC2YOLOConvert
+
+WIDTH, HEIGHT = 640, 480
+
+
+# (N, 4) xmin - ymin - xmax - ymax in pixels of (N, 5) yolo rows
+def pixel_corners(boxes):
+    x_center, y_center = boxes[:, 1] * WIDTH, boxes[:, 2] * HEIGHT
+    half_w, half_h = boxes[:, 3] * WIDTH / 2, boxes[:, 4] * HEIGHT / 2
+    return np.stack([x_center - half_w, y_center - half_h, x_center + half_w, y_center + half_h], axis=1)
+
+
+def test_yolo_voc_yolo_roundtrip(tmp_path):
+    imgs_path, txts_path = GenerateDataset(str(tmp_path), 50, WIDTH, HEIGHT, 8, 2)
+    xmls_path = os.path.join(str(tmp_path), 'xmls')
+    back_path = os.path.join(str(tmp_path), 'back')
+
+    to_voc = YOLO2VOCConvert(txts_path, xmls_path, imgs_path)
+    assert to_voc.yolo2voc()['failed'] == 0
+    assert VOC2YOLOConvert(xmls_path, back_path, to_voc.classes).voc2yolo()['failed'] == 0
+
+    txt_names = sorted(name for name in os.listdir(txts_path) if is_label_file(name))
+    assert txt_names == sorted(name for name in os.listdir(back_path) if is_label_file(name))
+    for txt_name in txt_names:
+        original = read_yolo_labels(os.path.join(txts_path, txt_name), np.float64)
+        back = read_yolo_labels(os.path.join(back_path, txt_name), np.float64)
+        assert np.array_equal(original[:, 0], back[:, 0]), txt_name
+        error = np.abs(pixel_corners(original) - pixel_corners(back)).max()
+        assert error < 1.0, (txt_name, error)
+
+
+# EXECUTE
+if __name__ == "__main__":
+
+    with tempfile.TemporaryDirectory() as root:
+        test_yolo_voc_yolo_roundtrip(root)
+    print("round trip ok")
@@ -0,0 +1,38 @@
+
+# Objective: the template writer of voc_xml.py gives the same bytes as the old xml.dom.minidom writer
+#
+# The files in golden/ were written by build_voc_document(...).writexml(f, indent='\t', newl='\n',
+# addindent='\t', encoding='utf-8'), the path yolo2voc used before format_voc_xml
+#
+# How to use:
+# python -m pytest test_voc_xml.py
+# python test_voc_xml.py          (same check without pytest)
+
+import os
+from voc_xml import format_voc_xml
+
+GOLDEN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden')
+
+# golden file -> (folder, filename, width, height, depth, [(name, xmin, ymin, xmax, ymax)])
+GOLDEN_CASES = {
+    'voc_objects.xml': ("JPEGImages", "000250.jpg", 640, 480, 3, [("person", 10, 20, 200, 300), ("car", 1, 2, 639, 479)]),
+    'voc_escaped.xml': ("a&b <c>", 'quote".jpg', 10, 20, 3, [("car & \"bus\" <x>", 1, 2, 3, 4)]),
+    'voc_empty.xml': ("JPEGImages", "000251.jpg", 64, 48, 3, []),
+}
+
+
+def read_golden(name):
+    with open(os.path.join(GOLDEN_PATH, name), 'r', encoding='utf-8', newline='') as f:
+        return f.read()
+
+
+def test_format_voc_xml_matches_golden_files():
+    for name, annotation in GOLDEN_CASES.items():
+        assert format_voc_xml(*annotation) == read_golden(name), name
+
+
+# EXECUTE
+if __name__ == "__main__":
+
+    test_format_voc_xml_matches_golden_files()
+    print("%d golden files ok" % len(GOLDEN_CASES))
@@ -0,0 +1,159 @@
+from xml.dom.minidom import Document
+
+'''
+Writers for voc format xml annotations:
+
+<annotation>
+    <folder>, <filename>, <size> (<width>, <height>, <depth>)
+    <object> (<name>, <pose>, <truncated>, <difficult>, <bndbox> (<xmin>, <ymin>, <xmax>, <ymax>)) for every target
+</annotation>
+
+format_voc_xml builds the text directly from string templates. build_voc_document builds the same
+annotation as a xml.dom.minidom Document (the way yolo2voc used to), its
+writexml(f, indent='\t', newl='\n', addindent='\t', encoding='utf-8') output is what format_voc_xml reproduces.
+'''
+
+VOC_HEADER_TEMPLATE = (
+    '<?xml version="1.0" encoding="utf-8"?>\n'
+    '\t<annotation>\n'
+    '\t\t<folder>%s</folder>\n'
+    '\t\t<filename>%s</filename>\n'
+    '\t\t<size>\n'
+    '\t\t\t<width>%d</width>\n'
+    '\t\t\t<height>%d</height>\n'
+    '\t\t\t<depth>%d</depth>\n'
+    '\t\t</size>\n'
+)
+
+VOC_OBJECT_TEMPLATE = (
+    '\t\t<object>\n'
+    '\t\t\t<name>%s</name>\n'
+    '\t\t\t<pose>Unspecified</pose>\n'
+    '\t\t\t<truncated>0</truncated>\n'
+    '\t\t\t<difficult>0</difficult>\n'
+    '\t\t\t<bndbox>\n'
+    '\t\t\t\t<xmin>%d</xmin>\n'
+    '\t\t\t\t<ymin>%d</ymin>\n'
+    '\t\t\t\t<xmax>%d</xmax>\n'
+    '\t\t\t\t<ymax>%d</ymax>\n'
+    '\t\t\t</bndbox>\n'
+    '\t\t</object>\n'
+)
+
+VOC_FOOTER = '\t</annotation>\n'
+
+
+# Same escaping minidom applies to text nodes
+def escape_text(text):
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace("\"", "&quot;").replace(">", "&gt;")
+
+
+# objects is a list of (name, xmin, ymin, xmax, ymax), returns the whole xml file as one string
+def format_voc_xml(folder_text, filename_text, width_img, height_img, depth_img, objects):
+    parts = [VOC_HEADER_TEMPLATE % (escape_text(folder_text), escape_text(filename_text), width_img, height_img, depth_img)]
+    for nameVal, xminVal, yminVal, xmaxVal, ymaxVal in objects:
+        parts.append(VOC_OBJECT_TEMPLATE % (escape_text(nameVal), xminVal, yminVal, xmaxVal, ymaxVal))
+    parts.append(VOC_FOOTER)
+    return ''.join(parts)
+
+
+# objects is a list of (name, xmin, ymin, xmax, ymax), returns a xml.dom.minidom Document
+def build_voc_document(folder_text, filename_text, width_img, height_img, depth_img, objects):
+    # Create tags in the xml tag file
+    xmlBuilder = Document()
+    # Create an annotation tag, which is also the root tag
+    annotation = xmlBuilder.createElement("annotation")
+
+    # Add a subtag to the label annotation
+    xmlBuilder.appendChild(annotation)
+
+    # Create subtag folder
+    folder = xmlBuilder.createElement("folder")
+    # Store content in the subtag folder, the content in the folder tag is the folder where the pictures are stored, for example: JPEGImages
+    folderContent = xmlBuilder.createTextNode(folder_text)  # Tag memory
+    folder.appendChild(folderContent)  # Save content to label
+    annotation.appendChild(folder)   # Put the stored folder tag under the annotation root tag
+
+    # Create subtag filename
+    filename = xmlBuilder.createElement("filename")
+    # Store the content in the subtag filename, the content in the filename tag is the name of the picture, for example: 000250.jpg
+    filenameContent = xmlBuilder.createTextNode(filename_text)  # Label content
+    filename.appendChild(filenameContent)
+    annotation.appendChild(filename)
+
+    # Store the shape of the picture in the xml tag
+    size = xmlBuilder.createElement("size")
+    # Create subtag width for size tag
+    width = xmlBuilder.createElement("width")  # size subtag width
+    widthContent = xmlBuilder.createTextNode(str(width_img))
+    width.appendChild(widthContent)
+    size.appendChild(width)   # Add width as a subtag of size
+    # Create a subtag height for the size tag
+    height = xmlBuilder.createElement("height")  # size subtag height
+    heightContent = xmlBuilder.createTextNode(str(height_img))  # The content stored in the xml tag is a string
+    height.appendChild(heightContent)
+    size.appendChild(height)  # Add width as a subtag of size
+    # Create a subtag depth for the size tag
+    depth = xmlBuilder.createElement("depth")  # size subtag width
+    depthContent = xmlBuilder.createTextNode(str(depth_img))
+    depth.appendChild(depthContent)
+    size.appendChild(depth)  # Add width as a subtag of size
+    annotation.appendChild(size)   # Add size as a subtag of annotation
+
+    # Stored in each object is ('car', xmin, ymin, xmax, ymax) an annotation target
+    for nameVal, xminVal, yminVal, xmaxVal, ymaxVal in objects:
+        # Start creating a label to label the label information of the target
+        object = xmlBuilder.createElement("object")  # Create object tag
+        # Create label category label
+        # Create name tag
+        imgName = xmlBuilder.createElement("name")  # Create name tag
+        imgNameContent = xmlBuilder.createTextNode(nameVal)
+        imgName.appendChild(imgNameContent)
+        object.appendChild(imgName)  # Add name as a subtag of object
+
+        # Create pose tag
+        pose = xmlBuilder.createElement("pose")
+        poseContent = xmlBuilder.createTextNode("Unspecified")
+        pose.appendChild(poseContent)
+        object.appendChild(pose)  # Add pose as the tag of object
+
+        # Create truncated tags
+        truncated = xmlBuilder.createElement("truncated")
+        truncatedContent = xmlBuilder.createTextNode("0")
+        truncated.appendChild(truncatedContent)
+        object.appendChild(truncated)
+
+        # Create difficult tags
+        difficult = xmlBuilder.createElement("difficult")
+        difficultContent = xmlBuilder.createTextNode("0")
+        difficult.appendChild(difficultContent)
+        object.appendChild(difficult)
+
+        # Create bndbox label (three-level label)
+        bndbox = xmlBuilder.createElement("bndbox")
+        # Create four more sub-labels (xmin, ymin, xmax, ymax) under the bndbox label to mark the coordinates and width and height information of the object
+        # In the voc format, label information: coordinates of the upper left corner (xmin, ymin) (xmax, ymax) coordinates of the lower right corner
+        # 1. Create xmin label
+        xmin = xmlBuilder.createElement("xmin")  # Create xmin label (four-level label)
+        xminContent = xmlBuilder.createTextNode(str(xminVal))
+        xmin.appendChild(xminContent)
+        bndbox.appendChild(xmin)
+        # 2, create ymin label
+        ymin = xmlBuilder.createElement("ymin")  # Create ymin label (four-level label)
+        yminContent = xmlBuilder.createTextNode(str(yminVal))
+        ymin.appendChild(yminContent)
+        bndbox.appendChild(ymin)
+        # 3. Create xmax label
+        xmax = xmlBuilder.createElement("xmax")  # Create xmax label (four-level label)
+        xmaxContent = xmlBuilder.createTextNode(str(xmaxVal))
+        xmax.appendChild(xmaxContent)
+        bndbox.appendChild(xmax)
+        # 4. Create a ymax label
+        ymax = xmlBuilder.createElement("ymax")  # Create ymax label (four-level label)
+        ymaxContent = xmlBuilder.createTextNode(str(ymaxVal))
+        ymax.appendChild(ymaxContent)
+        bndbox.appendChild(ymax)
+
+        object.appendChild(bndbox)
+        annotation.appendChild(object)  # Add object as a subtag of annotation
+    return xmlBuilder
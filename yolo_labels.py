@@ -0,0 +1,113 @@
+import os
+import numpy as np
+
+'''
+Array based reading of yolo format label files.
+
+Every line of a yolo txt is "class x_center y_center width height" (relative to the picture size).
+read_yolo_labels returns a whole file as one (N, 5) array instead of lists of strings, and
+LabelStore keeps a whole dataset as one concatenated box array plus a per-file offset index:
+
+    boxes   (M, 5) float32   class id, x_center, y_center, width, height of every box in the dataset
+    offsets (n+1,) int64     boxes of file i are boxes[offsets[i]:offsets[i+1]]
+    names   n txt file names
+
+so class discovery and statistics are numpy operations over all boxes at once.
+'''
+
+BOX_COLUMNS = 5
+
+
+def is_label_file(txt_name):
+    # classes.txt holds the class names, not boxes
+    return txt_name.split('.')[-1] == 'txt' and not txt_name.split('.')[0] == "classes"
+
+
+# Read one yolo txt file into a (N, 5) array, an empty file gives a (0, 5) array.
+# Every non-empty line must have exactly 5 values (a 6th column like a confidence is an error, not the next box)
+def read_yolo_labels(txt_file, dtype=np.float32):
+    rows = []
+    with open(txt_file, 'r') as f:
+        for line_number, line in enumerate(f, 1):
+            values = line.split()
+            if not values:
+                continue
+            if len(values) != BOX_COLUMNS:
+                raise ValueError("%s line %d: expected %d values per box, got %d values"
+                                 % (txt_file, line_number, BOX_COLUMNS, len(values)))
+            rows.append(values)
+    return np.array(rows, dtype=dtype).reshape(-1, BOX_COLUMNS)
+
+
+# Yield (txt_name, boxes) for every label file in txts_path, one file in memory at a time
+def iter_yolo_labels(txts_path, dtype=np.float32):
+    txts = sorted(txt for txt in os.listdir(txts_path) if is_label_file(txt))
+    for txt_name in txts:
+        yield txt_name, read_yolo_labels(os.path.join(txts_path, txt_name), dtype)
+
+
+# (x_center, y_center, width, height) relative -> (xmin, ymin, xmax, ymax) pixels for all boxes at once,
+# same arithmetic as the per-object float()/int() conversion yolo2voc used (1-based, truncated)
+def yolo_to_voc_boxes(boxes, width_img, height_img):
+    x_center = boxes[:, 1]*width_img + 1
+    y_center = boxes[:, 2]*height_img + 1
+    xmin = x_center - 0.5*boxes[:, 3]*width_img
+    ymin = y_center - 0.5*boxes[:, 4]*height_img
+    xmax = x_center + 0.5*boxes[:, 3]*width_img
+    ymax = y_center + 0.5*boxes[:, 4]*height_img
+    return np.stack([xmin, ymin, xmax, ymax], axis=1).astype(np.int64)  # astype truncates toward zero like int()
+
+
+class LabelStore:
+    def __init__(self, boxes, offsets, names):
+        self.boxes = boxes
+        self.offsets = offsets
+        self.names = names
+
+    # Build the store by streaming over all label files of txts_path
+    @classmethod
+    def from_dir(cls, txts_path):
+        names = []
+        counts = [0]
+        parts = []
+        for txt_name, boxes in iter_yolo_labels(txts_path):
+            names.append(txt_name)
+            counts.append(len(boxes))
+            parts.append(boxes)
+        boxes = np.concatenate(parts) if parts else np.zeros((0, BOX_COLUMNS), np.float32)
+        return cls(boxes, np.cumsum(counts, dtype=np.int64), names)
+
+    # Save as boxes.npy / offsets.npy / names.txt in store_path
+    def save(self, store_path):
+        if not os.path.exists(store_path):
+            os.makedirs(store_path)
+        np.save(os.path.join(store_path, 'boxes.npy'), self.boxes)
+        np.save(os.path.join(store_path, 'offsets.npy'), self.offsets)
+        with open(os.path.join(store_path, 'names.txt'), 'w') as f:
+            for name in self.names:
+                f.write(name + '\n')
+
+    # Load a saved store, with mmap=True the box array is memory-mapped instead of read into RAM
+    @classmethod
+    def load(cls, store_path, mmap=True):
+        mmap_mode = 'r' if mmap else None
+        boxes = np.load(os.path.join(store_path, 'boxes.npy'), mmap_mode=mmap_mode)
+        offsets = np.load(os.path.join(store_path, 'offsets.npy'))
+        with open(os.path.join(store_path, 'names.txt'), 'r') as f:
+            names = f.read().splitlines()
+        return cls(boxes, offsets, names)
+
+    def __len__(self):
+        return len(self.names)
+
+    # Boxes of the i-th label file
+    def file_boxes(self, i):
+        return self.boxes[self.offsets[i]:self.offsets[i + 1]]
+
+    # Sorted array of all class ids used in the dataset
+    def class_ids(self):
+        return np.unique(self.boxes[:, 0].astype(np.int64))
+
+    # Number of boxes per class id, index = class id
+    def class_counts(self):
+        return np.bincount(self.boxes[:, 0].astype(np.int64))